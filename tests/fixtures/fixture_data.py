@@ -2,9 +2,32 @@ import tempfile
 
 import pytest
 from mixer.backend.django import mixer as _mixer
+from core.test_runner import immediate_on_commit
 from posts.models import Post, Group
 
 
+@pytest.fixture(autouse=True)
+def temp_media_root(settings):
+    """Загруженные в тестах файлы не попадают в media проекта."""
+    with tempfile.TemporaryDirectory() as temp_directory:
+        settings.MEDIA_ROOT = temp_directory
+        yield temp_directory
+
+
+@pytest.fixture(autouse=True)
+def test_cache(settings):
+    """Тесты не очищают общий кеш сайта."""
+    settings.CACHES = settings.TEST_CACHES
+
+
+@pytest.fixture(autouse=True)
+def on_commit():
+    """Колбэки on_commit выполняются сразу: транзакция теста не
+    коммитится."""
+    with immediate_on_commit():
+        yield
+
+
 @pytest.fixture()
 def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
@@ -0,0 +1,236 @@
+"""Кеш в файле SQLite, общий для всех процессов на одном сервере.
+
+LocMemCache живёт внутри процесса: каждый воркер прогревает свой кеш
+заново, а сброс версии в одном процессе не виден остальным. Этот бэкенд
+хранит записи в одном файле SQLite в режиме WAL, поэтому читатели не
+блокируют писателя, а incr, add и get_many атомарны между процессами.
+Вытеснение — приблизительный LRU по времени последнего обращения
+с ограничением по числу записей (MAX_ENTRIES) и объёму (MAX_SIZE).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+# Обращения к ключам копятся в памяти и пишутся в базу пачкой, чтобы
+# чтение не превращалось в запись
+TOUCH_BUFFER_SIZE = 100
+CULL_CHECK_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 0))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # После fork соединение родителя использовать нельзя
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self._path, timeout=30,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db = db
+            local.pid = os.getpid()
+            local.touched = {}
+            local.writes = 0
+        return local.db
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _write(self, statements):
+        """Выполняет запросы одной транзакцией с блокировкой на запись."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            self._flush_touched(db)
+            result = statements(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._local.writes += 1
+        if self._local.writes % CULL_CHECK_EVERY == 0:
+            self._cull()
+        return result
+
+    def _touch(self, keys):
+        touched = self._local.touched
+        now = time.time()
+        for key in keys:
+            touched[key] = now
+        if len(touched) >= TOUCH_BUFFER_SIZE:
+            self._write(lambda db: None)
+
+    def _flush_touched(self, db):
+        touched = self._local.touched
+        if touched:
+            db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(accessed, key) for key, accessed in touched.items()],
+            )
+            touched.clear()
+
+    def _cull(self):
+        """Удаляет просроченные и самые давно читанные записи."""
+        def cull(db):
+            db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            count, size = db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+            ).fetchone()
+            over_count = count > self._max_entries
+            over_size = self._max_size and size > self._max_size
+            if over_count or over_size:
+                db.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache'
+                    ' ORDER BY accessed LIMIT ?)',
+                    (max(count // self._cull_frequency, 1),),
+                )
+        self._write(cull)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {self._key(key, version): key for key in keys}
+        if not key_map:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, expires FROM cache WHERE key IN (%s)'
+            % ', '.join('?' * len(key_map)),
+            list(key_map),
+        ).fetchall()
+        found = {
+            key_map[key]: self._decode(value)
+            for key, value, expires in rows
+            if expires is None or expires > now
+        }
+        self._touch(self.make_key(key, version=version) for key in found)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            encoded = self._encode(value)
+            size = 8 if isinstance(encoded, int) else len(encoded)
+            rows.append((self._key(key, version), encoded, expires, now,
+                         size))
+        self._write(lambda db: db.executemany(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)', rows
+        ))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        encoded = self._encode(value)
+        size = 8 if isinstance(encoded, int) else len(encoded)
+        now = time.time()
+
+        def add(db):
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       (key, now))
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                (key, encoded, self.get_backend_timeout(timeout), now, size),
+            )
+            return cursor.rowcount == 1
+        return self._write(add)
+
+    def incr(self, key, delta=1, version=None):
+        stored_key = self._key(key, version)
+        now = time.time()
+
+        def incr(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (stored_key,),
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                raise ValueError("Key '%s' not found" % key)
+            value = self._decode(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (self._encode(value), now, stored_key),
+            )
+            return value
+        return self._write(incr)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return self._write(lambda db: db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        ).rowcount == 1)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [(self._key(key, version),) for key in keys]
+        self._write(lambda db: db.executemany(
+            'DELETE FROM cache WHERE key = ?', keys
+        ))
+
+    def clear(self):
+        self._local.touched = {}
+        self._write(lambda db: db.execute('DELETE FROM cache'))
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами
+        pass
@@ -0,0 +1,8 @@
+from posts import notifications
+
+
+def unread_notifications(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'unread_notifications': notifications.unread_count(user)}
@@ -0,0 +1,47 @@
+"""Настройка соединений SQLite для продакшена.
+
+При открытии соединения включаются WAL и прагмы из SQLITE_PRAGMAS, а
+запросы вне транзакций повторяются, если база занята другим писателем
+дольше busy_timeout.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError
+
+RETRY_DELAY = 0.05
+
+
+def is_locked(error):
+    # «database table is locked» — то же самое в режиме общего кеша
+    message = str(error)
+    return 'database is locked' in message or 'table is locked' in message
+
+
+def retry_locked(execute, sql, params, many, context):
+    """Обёртка execute_wrapper: повторяет запрос при блокировке базы.
+
+    Внутри atomic() повтор бесполезен: транзакция держит снимок,
+    который писатель уже устарил, поэтому там ошибка уходит наверх.
+    """
+    connection = context['connection']
+    for attempt in range(settings.SQLITE_LOCKED_RETRIES):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if not is_locked(error) or connection.in_atomic_block:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt * random.random())
+    return execute(sql, params, many, context)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик connection_created."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    if retry_locked not in connection.execute_wrappers:
+        connection.execute_wrappers.append(retry_locked)
@@ -0,0 +1,169 @@
+"""Очередь фоновых задач в таблице основной базы.
+
+Задача ставится enqueue() в той же транзакции, что и запись, ради
+которой она нужна (вьюхи записи оборачивают сохранение в atomic()):
+откат убирает и её. Ждущая задача с ключом одна: это держит условное
+уникальное ограничение в базе.
+Исполнитель (manage.py run_jobs) забирает задачи пачкой: там, где СУБД
+умеет SELECT ... FOR UPDATE SKIP LOCKED, строки блокируются им, на
+SQLite — одним UPDATE с подзапросом.
+В обоих случаях задача получает аренду на JOBS_LEASE_SECONDS: если
+исполнитель умер, по истечении аренды её заберёт другой. Упавшая задача
+повторяется с экспоненциальной задержкой до max_attempts раз.
+"""
+import json
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Помечает функцию как задачу: исполнитель запускает только такие."""
+    func.is_job = True
+    return func
+
+
+def enqueue(func, *args, key='', delay=0, max_attempts=None):
+    """Ставит func(*args) в очередь; аргументы должны сериализоваться
+    в JSON. Если задача с тем же key ещё не выполнена, новая не ставится
+    и возвращается None.
+    """
+    if not getattr(func, 'is_job', False):
+        raise ValueError(f'{func!r} не помечена декоратором @task')
+    try:
+        # Точка сохранения: конфликт ключа не должен откатить
+        # транзакцию вызывающего
+        with transaction.atomic():
+            return Job.objects.create(
+                task=f'{func.__module__}.{func.__qualname__}',
+                payload=json.dumps(args),
+                key=key,
+                max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        if not key:
+            raise
+        return None
+
+
+def failed(key):
+    """Есть ли упавшая задача с ключом key: cleanup() их не удаляет."""
+    return Job.objects.filter(key=key, status=Job.FAILED).exists()
+
+
+def worker_name():
+    return uuid.uuid4().hex
+
+
+def _ready(now):
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now,
+            attempts__lt=F('max_attempts'))
+    ).order_by('run_at', 'pk')
+
+
+def claim(worker, batch_size):
+    """Берёт в аренду до batch_size готовых задач."""
+    now = timezone.now()
+    lease = {
+        'status': Job.RUNNING,
+        'locked_by': worker,
+        'locked_until': now + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+        'attempts': F('attempts') + 1,
+    }
+    if connections['default'].features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_ready(now).select_for_update(skip_locked=True)
+                       .values_list('pk', flat=True)[:batch_size])
+            Job.objects.filter(pk__in=ids).update(**lease)
+    else:
+        # У SQLite один писатель, так что UPDATE атомарен целиком
+        Job.objects.filter(pk__in=_ready(now).values('pk')[:batch_size]) \
+            .update(**lease)
+    return list(Job.objects.filter(locked_by=worker, status=Job.RUNNING,
+                                   locked_until__gt=now).order_by('pk'))
+
+
+def run(job):
+    """Выполняет задачу; возвращает True, если она удалась."""
+    try:
+        func = import_string(job.task)
+        if not getattr(func, 'is_job', False):
+            raise ValueError(f'{job.task} не помечена декоратором @task')
+        func(*json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Задача %s упала', job)
+        if job.attempts >= job.max_attempts:
+            changes = {'status': Job.FAILED, 'finished': timezone.now()}
+        else:
+            delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+            changes = {'status': Job.QUEUED,
+                       'run_at': timezone.now() + timedelta(seconds=delay)}
+        _release(job, error=error, **changes)
+        return False
+    _release(job, status=Job.DONE, finished=timezone.now(), error='')
+    return True
+
+
+def _release(job, **changes):
+    # Аренду могли перехватить, если задача шла дольше неё
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        locked_by='', locked_until=None, **changes)
+
+
+def work(worker, batch_size=10):
+    """Одна пачка задач; возвращает (выполнено, упало)."""
+    done = failed = 0
+    for job in claim(worker, batch_size):
+        if run(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+
+def cleanup():
+    """Удаляет старые выполненные задачи и хоронит брошенные."""
+    now = timezone.now()
+    Job.objects.filter(
+        status=Job.DONE,
+        finished__lt=now - timedelta(seconds=settings.JOBS_KEEP_DONE),
+    ).delete()
+    Job.objects.filter(status=Job.RUNNING, locked_until__lt=now,
+                       attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished=now, locked_by='', locked_until=None)
+
+
+def stats(window=60):
+    """Глубина очереди и пропускная способность за window секунд."""
+    now = timezone.now()
+    depth = dict(Job.objects.order_by().values_list('status')
+                 .annotate(total=Count('pk')))
+    oldest = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now).aggregate(
+        oldest=Min('run_at'))['oldest']
+    done = Job.objects.filter(
+        status=Job.DONE, finished__gte=now - timedelta(seconds=window)
+    ).count()
+    return {
+        'queued': depth.get(Job.QUEUED, 0),
+        'running': depth.get(Job.RUNNING, 0),
+        'failed': depth.get(Job.FAILED, 0),
+        'oldest_wait_s': round((now - oldest).total_seconds(), 1)
+        if oldest else 0,
+        'done_per_s': round(done / window, 2),
+    }
@@ -0,0 +1,78 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+def _backend(name, location):
+    params = {'OPTIONS': {'MAX_ENTRIES': 100000}, 'TIMEOUT': 300}
+    if name == 'locmem':
+        return LocMemCache('bench', params)
+    if name == 'filebased':
+        return FileBasedCache(os.path.join(location, 'files'), params)
+    return SQLiteCache(os.path.join(location, 'cache.sqlite3'), params)
+
+
+def _worker(name, location, worker, operations, keys, queue):
+    """Смесь операций как у ленты: чтения страниц, запись промахов,
+    incr версий. Промах на ключе, уже записанном другим процессом,
+    и есть цена раздельного кеша.
+    """
+    cache = _backend(name, location)
+    hits = 0
+    started = time.perf_counter()
+    for i in range(operations):
+        key = f'page:{(i * 7 + worker) % keys}'
+        if cache.get(key) is None:
+            cache.set(key, 'x' * 2048)
+        else:
+            hits += 1
+        if i % 20 == 0:
+            try:
+                cache.incr('version')
+            except ValueError:
+                cache.add('version', 1)
+    elapsed = time.perf_counter() - started
+    queue.put((operations / elapsed, hits / operations))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache, FileBasedCache и SQLiteCache '
+            'под нагрузкой из нескольких процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=500)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        results = {}
+        for name in ('locmem', 'filebased', 'sqlite'):
+            with tempfile.TemporaryDirectory() as location:
+                queue = context.Queue()
+                workers = [
+                    context.Process(target=_worker, args=(
+                        name, location, worker, options['operations'],
+                        options['keys'], queue,
+                    ))
+                    for worker in range(options['processes'])
+                ]
+                for process in workers:
+                    process.start()
+                stats = [queue.get() for _ in workers]
+                for process in workers:
+                    process.join()
+            results[name] = {
+                'ops_per_second': round(sum(ops for ops, _ in stats)),
+                'hit_rate': round(
+                    sum(rate for _, rate in stats) / len(stats), 3),
+            }
+        self.stdout.write(json.dumps(results, indent=2))
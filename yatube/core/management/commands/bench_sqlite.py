@@ -0,0 +1,139 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import RETRY_DELAY, is_locked
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author INTEGER,'
+    ' text TEXT, pub_date REAL)',
+    'CREATE INDEX post_author ON post (author, pub_date)',
+)
+# Django по умолчанию ждёт блокировку 5 секунд
+DEFAULT_TIMEOUT = 5
+
+Arm = namedtuple('Arm', 'persistent pragmas retries')
+# Каждый прогон добавляет к предыдущему ровно одну настройку, поэтому
+# разница соседних прогонов — вклад этой настройки, а не их смеси
+ARMS = {
+    'default': Arm(persistent=False, pragmas=False, retries=False),
+    'persistent': Arm(persistent=True, pragmas=False, retries=False),
+    'pragmas': Arm(persistent=True, pragmas=True, retries=False),
+    'retries': Arm(persistent=True, pragmas=True, retries=True),
+}
+
+
+def _connect(path, arm):
+    db = sqlite3.connect(path, timeout=DEFAULT_TIMEOUT,
+                         isolation_level=None)
+    if arm.pragmas:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+
+def _execute(db, sql, params, arm):
+    retries = settings.SQLITE_LOCKED_RETRIES if arm.retries else 0
+    for attempt in range(retries + 1):
+        try:
+            return db.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as error:
+            if not is_locked(error) or attempt == retries:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def _worker(path, arm, worker, operations, write_ratio, queue):
+    """Запрос ленты автора или вставка поста. Без persistent соединение
+    открывается заново на каждую операцию, как при CONN_MAX_AGE = 0.
+    """
+    db = _connect(path, arm) if arm.persistent else None
+    reads = writes = errors = 0
+    started = time.perf_counter()
+    for i in range(operations):
+        connection = db or _connect(path, arm)
+        try:
+            if (i * 7 + worker) % 100 < write_ratio * 100:
+                _execute(connection, 'INSERT INTO post (author, text,'
+                         ' pub_date) VALUES (?, ?, ?)',
+                         (i % 50, 'x' * 200, time.time()), arm)
+                writes += 1
+            else:
+                _execute(connection, 'SELECT id, text FROM post WHERE'
+                         ' author = ? ORDER BY pub_date DESC LIMIT 10',
+                         (i % 50,), arm)
+                reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        finally:
+            if db is None:
+                connection.close()
+    queue.put((reads, writes, errors, time.perf_counter() - started))
+
+
+def _total(result):
+    return result['reads_per_second'] + result['writes_per_second']
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite на чтение и запись, '
+            'добавляя по одной настройке: постоянное соединение, '
+            'SQLITE_PRAGMAS, повтор при блокировке')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=2000)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        results = {}
+        previous = None
+        for name, arm in ARMS.items():
+            with tempfile.TemporaryDirectory() as location:
+                path = os.path.join(location, 'bench.sqlite3')
+                db = _connect(path, arm)
+                for statement in SCHEMA:
+                    db.execute(statement)
+                db.executemany(
+                    'INSERT INTO post (author, text, pub_date)'
+                    ' VALUES (?, ?, ?)',
+                    ((i % 50, 'x' * 200, i) for i in range(options['rows'])),
+                )
+                db.close()
+                queue = context.Queue()
+                workers = [
+                    context.Process(target=_worker, args=(
+                        path, arm, worker, options['operations'],
+                        options['write_ratio'], queue,
+                    ))
+                    for worker in range(options['processes'])
+                ]
+                for process in workers:
+                    process.start()
+                stats = [queue.get() for _ in workers]
+                for process in workers:
+                    process.join()
+            elapsed = max(seconds for *_, seconds in stats)
+            results[name] = {
+                'reads_per_second': round(
+                    sum(reads for reads, *_ in stats) / elapsed),
+                'writes_per_second': round(
+                    sum(stat[1] for stat in stats) / elapsed),
+                'locked_errors': sum(stat[2] for stat in stats),
+            }
+            if previous is not None:
+                # Вклад настройки, добавленной этим прогоном
+                results[name]['vs_' + previous] = round(
+                    _total(results[name]) / max(_total(results[previous]), 1),
+                    2)
+            previous = name
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,17 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Печатает глубину очереди задач и пропускную способность в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60,
+                            help='За сколько секунд считать выполненные')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(jobs.stats(options['window']),
+                                     indent=2, sort_keys=True))
@@ -0,0 +1,95 @@
+import json
+import logging
+import multiprocessing
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from core import jobs
+
+logger = logging.getLogger('core.jobs')
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди в нескольких процессах '
+            'и потоках; раз в --stats-interval пишет в лог глубину '
+            'очереди и пропускную способность')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Потоков в каждом процессе')
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Сколько задач брать в аренду за раз')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--stats-interval', type=float, default=60.0)
+        parser.add_argument('--burst', action='store_true',
+                            help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        # Соединения не должны переходить в дочерние процессы
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=self.process, args=(options,))
+            for _ in range(options['processes'] - 1)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            done, failed = self.process(options)
+        finally:
+            for worker in workers:
+                worker.join()
+        if options['burst']:
+            self.stdout.write(f'Выполнено задач в этом процессе: {done}, '
+                              f'упало: {failed}')
+
+    def process(self, options):
+        results = []
+        threads = [
+            threading.Thread(target=self.thread, args=(options, results))
+            for _ in range(options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return (sum(done for done, _ in results),
+                sum(failed for _, failed in results))
+
+    def thread(self, options, results):
+        worker = jobs.worker_name()
+        total_done = total_failed = 0
+        window_done, window_started = 0, time.monotonic()
+        try:
+            while True:
+                try:
+                    done, failed = jobs.work(worker, options['batch'])
+                except DatabaseError:
+                    # Задачи с истёкшей арендой заберут при следующем заходе
+                    logger.exception('Не удалось взять задачи')
+                    time.sleep(options['poll'])
+                    continue
+                total_done += done
+                total_failed += failed
+                window_done += done + failed
+                elapsed = time.monotonic() - window_started
+                if elapsed >= options['stats_interval']:
+                    jobs.cleanup()
+                    logger.info(json.dumps({
+                        'worker': worker,
+                        'throughput_per_s': round(window_done / elapsed, 2),
+                        **jobs.stats(),
+                    }))
+                    window_done, window_started = 0, time.monotonic()
+                if done or failed:
+                    continue
+                if options['burst']:
+                    return
+                time.sleep(options['poll'])
+        finally:
+            results.append((total_done, total_failed))
+            connections.close_all()
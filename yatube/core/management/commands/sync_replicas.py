@@ -0,0 +1,39 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует файл основной базы SQLite в файлы реплик; '
+            'с --interval повторяет копирование, изображая репликацию')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Секунд между копированиями')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Реплики-копии бывают только у SQLite')
+        while True:
+            started = time.perf_counter()
+            for alias in settings.DATABASE_REPLICAS:
+                self.copy(primary['NAME'],
+                          connections[alias].settings_dict['NAME'])
+            self.stdout.write(
+                f'Реплик обновлено: {len(settings.DATABASE_REPLICAS)} '
+                f'за {time.perf_counter() - started:.2f} с'
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def copy(source, target):
+        # backup() даёт согласованный снимок даже во время записи
+        with sqlite3.connect(source) as primary, \
+                sqlite3.connect(target) as replica:
+            primary.backup(replica)
@@ -0,0 +1,83 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+# Имя метрики в Server-Timing и в логе
+METRICS = (
+    ('db', 'db'),
+    ('template', 'tpl'),
+    ('thumbnail', 'thumb'),
+)
+# Счётчики без длительности
+COUNTERS = (
+    ('object_cache_hit', 'objhit'),
+    ('object_cache_miss', 'objmiss'),
+)
+
+
+class ServerTimingMiddleware:
+    """Время SQL, шаблонов и миниатюр и попадания в кеш объектов в
+    заголовке Server-Timing и логе.
+
+    Замеряется доля запросов SERVER_TIMING_SAMPLE_RATE; остальные
+    проходят без обёрток. Шаблоны включают время вложенных миниатюр.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = timing.Timings()
+        token = timing.activate(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timing.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = self.header(timings, total)
+        self.log(request, response, timings, total)
+        return response
+
+    @staticmethod
+    def header(timings, total):
+        metrics = [
+            f'{metric};dur={timings.durations.get(name, 0) * 1000:.1f};'
+            f'desc="{timings.counts.get(name, 0)}"'
+            for name, metric in METRICS
+        ]
+        metrics.extend(f'{metric};desc="{timings.counts.get(name, 0)}"'
+                       for name, metric in COUNTERS)
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    @staticmethod
+    def log(request, response, timings, total):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+        }
+        for name, _ in METRICS:
+            record[f'{name}_ms'] = round(
+                timings.durations.get(name, 0) * 1000, 1)
+            record[f'{name}_count'] = timings.counts.get(name, 0)
+        for name, _ in COUNTERS:
+            record[name] = timings.counts.get(name, 0)
+        logger.info(json.dumps(record))
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200, verbose_name='Задача')),
+                ('payload', models.TextField(default='[]', verbose_name='Аргументы в JSON')),
+                ('key', models.CharField(blank=True, db_index=True, help_text='Пока задача с этим ключом ждёт, вторая не ставится', max_length=200, verbose_name='Ключ')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнена'), ('failed', 'Не удалась')], default='queued', max_length=10, verbose_name='Состояние')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveIntegerField(verbose_name='Предел попыток')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не раньше')),
+                ('locked_by', models.CharField(blank=True, max_length=64, verbose_name='Исполнитель')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Аренда до')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Поставлена')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Задача',
+                'verbose_name_plural': 'Задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'run_at'], name='job_ready_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'finished'], name='job_finished_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(models.Q(_negated=True, key=''), ('status__in', ('queued', 'running'))), fields=('key',), name='job_pending_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди core.jobs."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не удалась'),
+    )
+    task = models.CharField('Задача', max_length=200)
+    payload = models.TextField('Аргументы в JSON', default='[]')
+    key = models.CharField(
+        'Ключ', max_length=200, blank=True, db_index=True,
+        help_text='Пока задача с этим ключом ждёт, вторая не ставится'
+    )
+    status = models.CharField('Состояние', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Предел попыток')
+    run_at = models.DateTimeField('Не раньше', default=timezone.now)
+    locked_by = models.CharField('Исполнитель', max_length=64, blank=True)
+    locked_until = models.DateTimeField('Аренда до', null=True, blank=True)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+    finished = models.DateTimeField('Завершена', null=True, blank=True)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        indexes = [
+            models.Index(fields=('status', 'run_at'), name='job_ready_idx'),
+            models.Index(fields=('status', 'finished'),
+                         name='job_finished_idx'),
+        ]
+        constraints = [
+            # Одна ждущая задача на ключ: проверка в enqueue() без
+            # ограничения пропустила бы две одновременные постановки
+            models.UniqueConstraint(
+                fields=('key',),
+                condition=~Q(key='') & Q(status__in=('queued', 'running')),
+                name='job_pending_key_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
@@ -0,0 +1,77 @@
+"""Чтение с реплик, запись в основную базу.
+
+Вьюхи с декоратором read_from_replica читают со случайной реплики из
+DATABASE_REPLICAS, всё остальное идёт в default. После любой записи
+ReplicaPinMiddleware ставит cookie, и следующие REPLICA_PIN_SECONDS
+пользователь читает с основной базы, чтобы увидеть свой пост или
+комментарий, пока реплики догоняют.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote_primary', default=False)
+
+
+def reading_from_replica():
+    return bool(settings.DATABASE_REPLICAS) and _replica_reads.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def read_from_replica(view):
+    """Разрешает вьюхе читать с реплики, если пользователь не
+    закреплён за основной базой.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in SAFE_METHODS
+                or PIN_COOKIE in request.COOKIES):
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет за основной базой того, кто только что писал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+        if wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
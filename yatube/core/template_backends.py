@@ -0,0 +1,20 @@
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import timing
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timing.measure('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером времени рендера для Server-Timing."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
@@ -0,0 +1,19 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag
+def page_window(page, size=2):
+    """Номера страниц вокруг текущей плюс первая и последняя;
+    None на месте пропущенных номеров.
+    """
+    last = page.paginator.num_pages
+    numbers = sorted({1, last} | set(range(
+        max(page.number - size, 1), min(page.number + size, last) + 1)))
+    window = []
+    for number in numbers:
+        if window and number - window[-1] > 1:
+            window.append(None)
+        window.append(number)
+    return window
@@ -0,0 +1,44 @@
+import logging
+from unittest import mock
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def immediate_on_commit():
+    """TestCase в Django 2.2 откатывает транзакцию теста и колбэки
+    transaction.on_commit не вызывает: в тестах они выполняются сразу.
+    """
+    return mock.patch('django.db.transaction.on_commit',
+                      lambda func, using=None: func())
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с кешем TEST_CACHES и on_commit без коммита.
+
+    Тесты вызывают cache.clear(), а общий SQLite-кеш из CACHES — это
+    кеш запущенного сайта. Строки INFO с таймингами из LOGGING в выводе
+    тестов не нужны, ошибки по-прежнему печатаются.
+    """
+
+    QUIET_LOGGERS = ('core.middleware', 'core.jobs')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=settings.TEST_CACHES)
+        self._caches.enable()
+        self._on_commit = immediate_on_commit()
+        self._on_commit.start()
+        self._levels = {}
+        for name in self.QUIET_LOGGERS:
+            logger = logging.getLogger(name)
+            self._levels[name] = logger.level
+            logger.setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        for name, level in self._levels.items():
+            logging.getLogger(name).setLevel(level)
+        self._on_commit.stop()
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,6 +1,112 @@
-from django.test import TestCase, Client
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db import (IntegrityError, OperationalError, connection,
+                       transaction)
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+from django.utils import timezone
 from http import HTTPStatus
 
+from .cache import SQLiteCache
+from .db import retry_locked
+from .models import Job
+from . import jobs, routers
+from posts import thumbnails
+
+User = get_user_model()
+
+
+class ServerTimingTests(TestCase):
+    def test_timings_in_header_and_log(self):
+        """Время SQL и шаблонов попадает в Server-Timing и лог"""
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            response = self.client.get('/')
+        header = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'thumb;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/')
+        self.assertGreater(record['db_count'], 0)
+        self.assertEqual(record['template_count'], 1)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class SQLiteTuningTests(TestCase):
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertIn(retry_locked, connection.execute_wrappers)
+
+    def test_locked_statement_retried_outside_transaction(self):
+        """Блокировка повторяется вне транзакции и всплывает внутри"""
+        calls = []
+
+        def execute(sql, params, many, context):
+            calls.append(sql)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        context = {'connection': mock.Mock(in_atomic_block=False)}
+        self.assertEqual(retry_locked(execute, 'SELECT 1', (), False,
+                                      context), 'ok')
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        context = {'connection': mock.Mock(in_atomic_block=True)}
+        with self.assertRaises(OperationalError):
+            retry_locked(execute, 'SELECT 1', (), False, context)
+        self.assertEqual(len(calls), 1)
+
+
+class ReplicaRouterTests(TestCase):
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_replica_only_inside_decorated_views(self):
+        router = routers.ReplicaRouter()
+        seen = []
+
+        @routers.read_from_replica
+        def view(request):
+            seen.append(router.db_for_read(None))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        view(request)
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        view(request)
+        view(RequestFactory().post('/'))
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        self.assertEqual(router.db_for_read(None), 'default')
+        self.assertEqual(router.db_for_write(None), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+    # Реплика-зеркало: запросы выполняются, проверяется только cookie
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_writer_pinned_to_primary(self):
+        """После записи ставится cookie, чтение — без неё"""
+        user = User.objects.create_user(username='writer')
+        self.client.force_login(user)
+        response = self.client.get('/')
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        response = self.client.post('/create/', {'text': 'Новый пост'})
+        self.assertEqual(
+            response.cookies[routers.PIN_COOKIE]['max-age'], 5)
+
 
 class ViewTestClass(TestCase):
     def setUp(self) -> None:
@@ -11,3 +117,164 @@ class ViewTestClass(TestCase):
         response = self.guest_client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def _increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """get, set, add, get_many, delete работают как у LocMemCache"""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'value': 1}, 'new': 'value'}
+        )
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_keys_are_missing(self):
+        self.cache.set('key', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'value'))
+
+    def test_shared_between_processes(self):
+        """Запись и атомарный incr видны из других процессов"""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment, args=(self.path, 50))
+                   for _ in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_least_recently_used_evicted(self):
+        """Вытесняются записи, которые дольше всего не читали"""
+        cache = SQLiteCache(self.path, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}
+        })
+        for i in range(12):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache._cull()
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+
+
+CALLS = []
+
+
+@jobs.task
+def remember(value):
+    CALLS.append(value)
+
+
+@jobs.task
+def explode():
+    raise RuntimeError('сбой')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_job_enqueued_with_transaction(self):
+        """Откат записи убирает и её задачу"""
+        with transaction.atomic():
+            jobs.enqueue(remember, 'откат')
+            transaction.set_rollback(True)
+        jobs.enqueue(remember, 'коммит')
+        self.assertEqual(jobs.work('worker'), (1, 0))
+        self.assertEqual(CALLS, ['коммит'])
+        self.assertEqual(jobs.work('worker'), (0, 0))
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_failed_job_retried_then_failed(self):
+        job = jobs.enqueue(explode, max_attempts=2)
+        self.assertEqual(jobs.work('worker'), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError', job.error)
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(jobs.work('worker'), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(jobs.stats()['failed'], 1)
+
+    def test_expired_lease_taken_by_other_worker(self):
+        jobs.enqueue(remember, 'долгая')
+        [job] = jobs.claim('first', 10)
+        self.assertEqual(jobs.claim('second', 10), [])
+        Job.objects.update(locked_until=timezone.now())
+        [stolen] = jobs.claim('second', 10)
+        self.assertEqual(stolen.attempts, 2)
+        # Первый исполнитель уже не владеет задачей
+        jobs.run(job)
+        self.assertEqual(Job.objects.get().locked_by, 'second')
+        jobs.run(stolen)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_key_deduplicates_pending_jobs(self):
+        with mock.patch('posts.thumbnails.default.backend') as backend:
+            for _ in range(2):
+                thumbnails.schedule('posts/image.jpg', '960x339',
+                                    {'crop': 'center'})
+            self.assertEqual(Job.objects.count(), 1)
+            jobs.work('worker')
+        backend.generate.assert_called_once_with(
+            'posts/image.jpg', '960x339', crop='center')
+
+    def test_key_unique_while_pending(self):
+        """Две ждущие задачи с одним ключом не запишутся и в обход
+        проверки: их не пускает ограничение в базе"""
+        job = jobs.enqueue(remember, 'первая', key='один')
+        with transaction.atomic():
+            self.assertIsNone(jobs.enqueue(remember, 'вторая', key='один'))
+            # Транзакция вызывающего пережила конфликт
+            jobs.enqueue(remember, 'без ключа')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(task=job.task, key='один', max_attempts=1)
+        jobs.work('worker')
+        self.assertEqual(CALLS, ['первая', 'без ключа'])
+        self.assertTrue(jobs.enqueue(remember, 'снова', key='один'))
+
+    def test_password_reset_email_sent_by_worker(self):
+        User.objects.create_user(username='user', email='user@example.com',
+                                 password='pass')
+        response = self.client.post(reverse('users:password_reset_form'),
+                                    {'email': 'user@example.com'})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(mail.outbox, [])
+        self.assertNotIn('/reset/', Job.objects.get().payload)
+        jobs.work('worker')
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertIn('/reset/', mail.outbox[0].body)
+
+
+class JobWorkerCommandTests(TransactionTestCase):
+    def test_threads_share_queue_without_duplicates(self):
+        for i in range(30):
+            jobs.enqueue(remember, i)
+        call_command('run_jobs', '--burst', '--threads', '3', '--batch',
+                     '4', stdout=io.StringIO())
+        self.assertEqual(sorted(CALLS[-30:]), list(range(30)))
+        self.assertEqual(jobs.stats()['queued'], 0)
@@ -0,0 +1,55 @@
+"""Замеры времени внутри запроса: SQL, шаблоны, миниатюры, а также
+счётчики событий вроде попаданий в кеш объектов.
+
+Замеры собираются, только пока ServerTimingMiddleware включила их для
+запроса; в остальное время measure() ничего не делает.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timings', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+
+    def add(self, name, duration):
+        self.durations[name] = self.durations.get(name, 0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def activate(timings):
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def count(name, number=1):
+    """Засчитывает событие без длительности, например попадание в кеш."""
+    timings = _current.get()
+    if timings is not None and number:
+        timings.counts[name] = timings.counts.get(name, 0) + number
+
+
+@contextmanager
+def measure(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper()."""
+    with measure('db'):
+        return execute(sql, params, many, context)
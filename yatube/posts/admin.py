@@ -1,16 +1,103 @@
 from django.contrib import admin
 
-from .models import Post
-from .models import Group
+from . import search
+from .models import Comment, Follow, Group, Post
+from .paginator import EstimatedCountPaginator
+
+ADMIN_SEARCH_LIMIT = 1000
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    """Фильтр по логину из поля ввода вместо списка всех пользователей."""
+    template = 'admin/input_filter.html'
+    title = 'автор'
+    parameter_name = 'author'
+    field = 'author'
+
+    def lookups(self, request, model_admin):
+        # Фильтр выводится, только если есть хоть один вариант
+        return (('', ''),)
+
+    def choices(self, changelist):
+        yield {
+            'query_params': {
+                name: value for name, value in changelist.params.items()
+                if name != self.parameter_name
+            },
+            'query_string': changelist.get_query_string(
+                remove=[self.parameter_name]),
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                **{f'{self.field}__username': self.value()})
+        return queryset
+
+
+class FollowerFilter(UsernameFilter):
+    title = 'подписчик'
+    parameter_name = 'user'
+    field = 'user'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список, который не пересчитывает таблицу и не тянет связанные
+    объекты по одному.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name in self.raw_id_fields or request is None:
+            return formfield
+        # Варианты читаются один раз на запрос, а не на каждую строку
+        # list_editable
+        cached = request.__dict__.setdefault('admin_choices', {})
+        if db_field.name not in cached:
+            cached[db_field.name] = list(formfield.choices)
+        formfield.choices = cached[db_field.name]
+        # RelatedFieldWidgetWrapper рисует вложенный виджет
+        getattr(formfield.widget, 'widget', formfield.widget).choices = (
+            cached[db_field.name])
+        return formfield
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
+    list_select_related = ('author', 'group')
     list_editable = ('group',)
     search_fields = ('text',)
-    list_filter = ('pub_date', 'author',)
-    empty_value_display = '-пусто-'
+    list_filter = ('pub_date', UsernameFilter)
+    raw_id_fields = ('author',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу вместо LIKE '%...%' по всей таблице."""
+        terms = search.tokenize(search_term)
+        if not terms:
+            return queryset, False
+        ids = search.get_backend().ids(terms, 0, ADMIN_SEARCH_LIMIT)
+        return queryset.filter(pk__in=ids), False
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post_id')
+    list_select_related = ('author',)
+    list_filter = ('created', UsernameFilter)
+    raw_id_fields = ('post', 'author')
+
+
+@admin.register(Follow)
+class FollowAdmin(LargeTableAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    list_filter = (FollowerFilter, UsernameFilter)
+    raw_id_fields = ('user', 'author')
 
 
 admin.site.register(Group)
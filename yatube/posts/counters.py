@@ -0,0 +1,109 @@
+from django.db.models import Count, F
+
+from . import object_cache
+from .models import Comment, Follow, Post, User, UserCounters
+from .paginator import iterate_in_batches
+
+COUNTER_FIELDS = ('posts', 'followers', 'following')
+
+
+def for_user(user):
+    """Счётчики пользователя; нулевые, если строки ещё нет."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        return UserCounters(user=user)
+
+
+def change(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя на заданные величины."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if UserCounters.objects.filter(user_id=user_id).update(**updates):
+        return
+    if all(delta > 0 for delta in deltas.values()):
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=user_id)], ignore_conflicts=True
+        )
+        UserCounters.objects.filter(user_id=user_id).update(**updates)
+
+
+def change_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+    # update() не шлёт сигналов, кешированный пост сбрасываем сами
+    object_cache.invalidate(Post, [post_id])
+
+
+def _grouped_counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by().values(field)
+        .annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def recount_users(batch_size=1000):
+    """Пересчитывает счётчики пользователей, возвращает число
+    исправленных строк.
+    """
+    repaired = 0
+    for batch in iterate_in_batches(User.objects.only('pk'), batch_size):
+        repaired += recount_user_ids([user.pk for user in batch])
+    return repaired
+
+
+def recount_user_ids(ids):
+    """Пересчитывает счётчики пользователей ids."""
+    ids = list(ids)
+    actual = {
+        'posts': _grouped_counts(Post.objects, 'author', ids),
+        'followers': _grouped_counts(Follow.objects, 'author', ids),
+        'following': _grouped_counts(Follow.objects, 'user', ids),
+    }
+    stored = UserCounters.objects.in_bulk(ids)
+    changed, missing = [], []
+    for user_id in ids:
+        values = {field: actual[field].get(user_id, 0)
+                  for field in COUNTER_FIELDS}
+        counters = stored.get(user_id)
+        if counters is None:
+            missing.append(UserCounters(user_id=user_id, **values))
+        elif any(getattr(counters, field) != value
+                 for field, value in values.items()):
+            for field, value in values.items():
+                setattr(counters, field, value)
+            changed.append(counters)
+    UserCounters.objects.bulk_update(changed, COUNTER_FIELDS)
+    UserCounters.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(changed) + len(missing)
+
+
+def recount_comments(batch_size=1000):
+    """Пересчитывает comments_count постов, возвращает число
+    исправленных постов.
+    """
+    repaired = 0
+    posts = Post.objects.only('pk', 'comments_count')
+    for batch in iterate_in_batches(posts, batch_size):
+        repaired += _recount_posts(batch)
+    return repaired
+
+
+def recount_post_ids(ids):
+    """Пересчитывает comments_count постов ids."""
+    return _recount_posts(
+        Post.objects.filter(pk__in=list(ids)).only('pk', 'comments_count'))
+
+
+def _recount_posts(posts):
+    actual = _grouped_counts(
+        Comment.objects, 'post', [post.pk for post in posts]
+    )
+    changed = []
+    for post in posts:
+        if post.comments_count != actual.get(post.pk, 0):
+            post.comments_count = actual.get(post.pk, 0)
+            changed.append(post)
+    Post.objects.bulk_update(changed, ('comments_count',))
+    object_cache.invalidate(Post, [post.pk for post in changed])
+    return len(changed)
@@ -0,0 +1,281 @@
+"""Кеш лент: версии областей для ETag и списки id постов.
+
+Лента (index, group:<id>, profile:<id>, follow:<id>) хранится как
+упорядоченный список id её последних FEED_IDS_LENGTH постов, а страница
+собирается из кеша объектов одним get_many на модель. Новый пост не
+сбрасывает список, а занимает следующий по cache.incr слот головы
+ленты; читатель подмешивает слоты, которых ещё нет в списке. Если
+списка нет, пост только сдвигает голову: читатель, который как раз
+собирает список по снимку без этого поста, не найдёт слота и следующий
+соберёт список заново. Правки, удаления и смена подписок просто
+удаляют список.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+
+from core import routers
+from . import notifications, object_cache
+from .models import Group, Post, User
+from .paginator import NEXT, PREVIOUS, CursorPaginator, paginate
+
+FEED_IDS_LENGTH = 1000
+# После стольких новых постов список собирается заново одним запросом
+PREPEND_LIMIT = 100
+
+
+def _version_key(scope):
+    return f'feed_version:{scope}'
+
+
+def versions(*scopes):
+    """Текущие версии областей кеша: index, group:<id>, profile:<id>,
+    follow:<id>, post:<id>, counters:<id>.
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Версия от текущего времени не совпадёт ни с одной из
+            # вытесненных из кеша, поэтому старые страницы не всплывут
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bumped_key(scope):
+    return f'feed_bumped:{scope}'
+
+
+def bump(*scopes):
+    """Сбрасывает кеш областей, меняя их версии."""
+    for scope in set(scopes):
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    if settings.DATABASE_REPLICAS:
+        cache.set_many({_bumped_key(scope): True for scope in scopes},
+                       settings.REPLICA_PIN_SECONDS)
+
+
+def replica_may_lag(scopes):
+    """Данные читаются с реплики, а области менялись так недавно, что
+    реплика могла ещё не догнать: такую страницу нельзя запоминать под
+    новой версией ни в кеше, ни в ETag.
+    """
+    return routers.reading_from_replica() and bool(
+        cache.get_many([_bumped_key(scope) for scope in scopes]))
+
+
+def etag(request, *scopes):
+    """ETag страницы: версии её областей и пользователь, под которого
+    она отрисована, вместе с его счётчиком уведомлений в шапке.
+    Считается без запросов к базе, пока счётчик лежит в кеше.
+    """
+    if replica_may_lag(scopes):
+        return None
+    parts = [str(request.user.pk)]
+    if request.user.is_authenticated:
+        parts.append(str(notifications.unread_count(request.user)))
+    parts.extend(f'{scope}@{version}'
+                 for scope, version in zip(scopes, versions(*scopes)))
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+def _ids_keys(scopes):
+    """{область: ключ списка}. Посты знаменитостей не раскладываются по
+    лентам подписок, поэтому в ключе такой ленты — версия
+    celebrity_posts: их новый пост сбрасывает все списки разом.
+    """
+    keys, generation = {}, None
+    for scope in scopes:
+        if scope.startswith('follow:'):
+            if generation is None:
+                generation = versions('celebrity_posts')[0]
+            keys[scope] = f'feed_ids:{scope}@{generation}'
+        else:
+            keys[scope] = f'feed_ids:{scope}'
+    return keys
+
+
+def _head_key(scope):
+    return f'feed_head:{scope}'
+
+
+def _slot_key(scope, number):
+    return f'feed_head:{scope}:{number}'
+
+
+def prepend(post_id, *scopes):
+    """Добавляет новый пост в головы закешированных списков областей."""
+    keys = _ids_keys(scopes)
+    cached = cache.get_many(list(keys.values())
+                            + [_head_key(scope) for scope in keys])
+    for scope, key in keys.items():
+        if key in cached:
+            cache.add(_head_key(scope), 0, None)
+            number = cache.incr(_head_key(scope))
+            cache.set(_slot_key(scope, number), post_id,
+                      settings.FEED_CACHE_TIMEOUT)
+        elif _head_key(scope) in cached:
+            # Списка нет, но его мог начать собирать читатель: голова
+            # без слота не даст сохранённому им списку сойтись
+            try:
+                cache.incr(_head_key(scope))
+            except ValueError:
+                pass
+
+
+def drop(*scopes):
+    """Удаляет списки областей: их соберут заново при чтении."""
+    cache.delete_many(list(_ids_keys(scopes).values()))
+
+
+def feed_ids(object_list, scope, cacheable=True, load_ids=None):
+    """(id постов ленты от новых к старым, весь ли это список).
+
+    load_ids(limit) собирает список сам, если у ленты есть способ
+    дешевле сортировки object_list.
+    """
+    key, head_key = _ids_keys([scope])[scope], _head_key(scope)
+    found = cache.get_many([key, head_key])
+    head = found.get(head_key, 0)
+    state = found.get(key)
+    if state is not None and state['head'] <= head <= (
+            state['head'] + PREPEND_LIMIT):
+        slots = cache.get_many([_slot_key(scope, number) for number in
+                                range(state['head'] + 1, head + 1)])
+        # Вытесненный слот — и пост неизвестно где: собираем заново
+        if len(slots) == head - state['head']:
+            known = set(state['ids'])
+            fresh = sorted((post_id for post_id in slots.values()
+                            if post_id not in known), reverse=True)
+            return fresh + state['ids'], state['complete']
+    if head_key not in found:
+        # Голова заводится до запроса, чтобы prepend() во время сборки
+        # её сдвинул
+        cache.add(head_key, 0, None)
+    if load_ids is not None:
+        ids = load_ids(FEED_IDS_LENGTH + 1)
+    else:
+        ids = list(object_list.order_by('-pub_date', '-id').values_list(
+            'pk', flat=True)[:FEED_IDS_LENGTH + 1])
+    state = {'ids': ids[:FEED_IDS_LENGTH], 'head': head,
+             'complete': len(ids) <= FEED_IDS_LENGTH}
+    if cacheable:
+        cache.set(key, state, settings.FEED_CACHE_TIMEOUT)
+    return state['ids'], state['complete']
+
+
+class StaleFeed(Exception):
+    """В списке id есть пост, которого уже нет в базе."""
+
+
+def hydrate(ids):
+    """Посты по id в том же порядке, с авторами и группами из кеша
+    объектов; на промахи — по одному in_bulk на модель.
+    """
+    posts = object_cache.get_many(Post, ids)
+    authors = object_cache.get_many(
+        User, [post.author_id for post in posts.values()])
+    groups = object_cache.get_many(
+        Group, [post.group_id for post in posts.values()
+                if post.group_id is not None])
+    rows = []
+    for post_id in ids:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        post.author = authors[post.author_id]
+        if post.group_id is not None:
+            post.group = groups[post.group_id]
+        rows.append(post)
+    return rows
+
+
+def _rows(page_ids):
+    rows = hydrate(page_ids)
+    if len(rows) < len(page_ids):
+        raise StaleFeed
+    return rows
+
+
+def _keyset_page(paginator, ids, complete, cursor):
+    """Страница по курсору из списка id; None, если ответ за пределами
+    списка и нужен запрос к базе.
+    """
+    direction, key = paginator.decode_cursor(cursor)
+    per_page = paginator.per_page
+    if key is None:
+        start = 0
+    elif key[1] in ids:
+        start = ids.index(key[1]) + 1
+    else:
+        return None
+    if direction == PREVIOUS and key is not None:
+        end = start - 1
+        if end <= per_page:
+            return _keyset_page(paginator, ids, complete, None)
+        page_ids = ids[end - per_page:end]
+        has_previous = has_next = True
+    else:
+        page_ids = ids[start:start + per_page + 1]
+        if len(page_ids) <= per_page and not complete:
+            return None
+        has_previous = key is not None
+        has_next = len(page_ids) > per_page
+        page_ids = page_ids[:per_page]
+    rows = _rows(page_ids)
+    page = Page(rows, 1, paginator)
+    page.is_keyset = True
+    page.previous_cursor = (paginator.encode_cursor(PREVIOUS, rows[0])
+                            if has_previous and rows else None)
+    page.next_cursor = (paginator.encode_cursor(NEXT, rows[-1])
+                        if has_next and rows else None)
+    return page
+
+
+def _numbered_page(paginator, ids, complete, number):
+    if complete:
+        paginator.count = len(ids)
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    bottom = (number - 1) * paginator.per_page
+    if not complete and bottom + paginator.per_page > len(ids):
+        return None
+    return Page(_rows(ids[bottom:bottom + paginator.per_page]), number,
+                paginator)
+
+
+def cached_paginate(request, object_list, per_page, *scopes,
+                    load_ids=None):
+    """Страница ленты из списка id последней области; глубже списка и
+    при расхождении с базой — обычная пагинация запросом.
+    """
+    scope = scopes[-1]
+    paginator = CursorPaginator(object_list, per_page,
+                                count_key=':'.join(scopes))
+    ids, complete = feed_ids(object_list, scope,
+                             cacheable=not replica_may_lag(scopes),
+                             load_ids=load_ids)
+    number, cursor = request.GET.get('page'), request.GET.get('cursor')
+    try:
+        if number is not None:
+            page = _numbered_page(paginator, ids, complete, number)
+        else:
+            page = _keyset_page(paginator, ids, complete, cursor)
+    except StaleFeed:
+        drop(scope)
+        page = None
+    if page is None:
+        page = paginate(request, object_list, per_page, paginator)
+    return page
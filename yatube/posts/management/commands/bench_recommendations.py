@@ -0,0 +1,58 @@
+import json
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import CSR, score
+
+
+def _edges(users, edges, seed):
+    """Подписки, упорядоченные по подписчику, без списка в памяти:
+    у каждого пользователя случайное число подписок, авторы выбираются
+    по степенному закону.
+    """
+    rng = random.Random(seed)
+    average = edges / users
+    for user in range(1, users + 1):
+        count = min(int(rng.expovariate(1 / average)), users - 1)
+        authors = {int(users ** rng.random()) for _ in range(count)}
+        for author in sorted(authors - {user}):
+            yield user, author
+
+
+class Command(BaseCommand):
+    help = ('Строит синтетический граф подписок в CSR и считает '
+            'рекомендации для выборки пользователей')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges', type=int, default=2000000)
+        parser.add_argument('--sample', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        users = options['users']
+        tracemalloc.start()
+        started = time.perf_counter()
+        follows = CSR.from_sorted_pairs(
+            _edges(users, options['edges'], options['seed']), users + 1)
+        build = time.perf_counter() - started
+        empty = CSR.from_sorted_pairs((), 1)
+        rng = random.Random(options['seed'])
+        sample = [rng.randint(1, users) for _ in range(options['sample'])]
+        started = time.perf_counter()
+        for user_id in sample:
+            score(user_id, follows, empty, empty)
+        scoring = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(json.dumps({
+            'users': users,
+            'edges': len(follows.indices),
+            'build_seconds': round(build, 2),
+            'csr_megabytes': round(follows.nbytes / 2 ** 20, 1),
+            'peak_megabytes': round(peak / 2 ** 20, 1),
+            'score_ms_per_user': round(scoring / len(sample) * 1000, 2),
+        }, indent=2))
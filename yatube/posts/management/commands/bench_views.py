@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+
+SAMPLE_TARGETS = 20
+
+
+def percentile(samples, q):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку и число запросов к базе у страниц и '
+            'форм через тестовый клиент, печатает JSON для сравнения '
+            'между коммитами. Запросы на запись откатываются, кеш — '
+            'отдельный, во временном файле.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Замеров на каждую страницу')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--username',
+                            help='Кто открывает ленту подписок и пишет; '
+                                 'по умолчанию самый активный подписчик')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON')
+
+    def handle(self, *args, **options):
+        # Откат не вернёт кеш: слоты голов лент указывали бы на id
+        # откаченных постов, которые потом достанутся настоящим
+        with tempfile.TemporaryDirectory() as location:
+            bench_cache = dict(settings.CACHES['default'],
+                               LOCATION=os.path.join(location, 'cache'))
+            with override_settings(CACHES={'default': bench_cache}):
+                try:
+                    self.bench(options)
+                finally:
+                    cache.close()
+
+    def bench(self, options):
+        self.random = random.Random(options['seed'])
+        self.user = self.bench_user(options['username'])
+        self.client = Client()
+        self.client.force_login(self.user)
+        results = {}
+        for name, request in self.scenarios():
+            results[name] = self.measure(request, options)
+        report = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        self.stdout.write(report)
+
+    def bench_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        user = users.order_by('-counters__following', 'pk').first()
+        if user is None:
+            raise CommandError('Нет пользователей, запустите seed_data')
+        return user
+
+    def sample(self, queryset):
+        return list(queryset.order_by('?')[:SAMPLE_TARGETS])
+
+    def scenarios(self):
+        """Пары (имя, функция запроса); каждый вызов берёт случайную
+        цель, чтобы замер не сводился к одной горячей странице.
+        """
+        groups = self.sample(Group.objects.values_list('pk', 'slug'))
+        authors = self.sample(
+            User.objects.filter(posts__isnull=False).distinct()
+            .values_list('username', flat=True))
+        posts = self.sample(Post.objects.values_list('pk', flat=True))
+        own_posts = self.sample(
+            self.user.posts.values_list('pk', flat=True))
+        strangers = self.sample(
+            User.objects.exclude(pk=self.user.pk)
+            .exclude(following__user=self.user)
+            .values_list('username', flat=True))
+        followed = self.sample(
+            Follow.objects.filter(user=self.user)
+            .values_list('author__username', flat=True))
+        get = self.client.get
+        post = self.client.post
+        choice = self.random.choice
+        yield 'index', lambda: get(reverse('posts:index'))
+        if groups:
+            yield 'group_posts', lambda: get(reverse(
+                'posts:group_list', args=[choice(groups)[1]]))
+        if authors:
+            yield 'profile', lambda: get(reverse(
+                'posts:profile', args=[choice(authors)]))
+        if posts:
+            yield 'post_detail', lambda: get(reverse(
+                'posts:post_detail', args=[choice(posts)]))
+        yield 'follow_index', lambda: get(reverse('posts:follow_index'))
+        yield 'post_create', lambda: post(reverse('posts:post_create'), {
+            'text': 'Замер создания поста',
+            'group': choice(groups)[0] if groups else '',
+        })
+        if own_posts:
+            yield 'post_edit', lambda: post(reverse(
+                'posts:post_edit', args=[choice(own_posts)]
+            ), {'text': 'Замер правки поста'})
+        if posts:
+            yield 'add_comment', lambda: post(reverse(
+                'posts:add_comment', args=[choice(posts)]
+            ), {'text': 'Замер комментария'})
+        if strangers:
+            yield 'profile_follow', lambda: get(reverse(
+                'posts:profile_follow', args=[choice(strangers)]))
+        if followed:
+            yield 'profile_unfollow', lambda: get(reverse(
+                'posts:profile_unfollow', args=[choice(followed)]))
+
+    def measure(self, request, options):
+        timings, queries, statuses = [], [], set()
+        for i in range(options['warmup'] + options['requests']):
+            if options['cold']:
+                cache.clear()
+            # Запись не должна менять базу между прогонами
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request()
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if i < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+        return {
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+            'statuses': sorted(statuses),
+        }
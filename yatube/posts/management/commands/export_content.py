@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгружает группы, посты, комментарии или подписки в JSONL/CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(transfer.KINDS))
+        parser.add_argument('path', help='Файл или - для stdout')
+        parser.add_argument('--format', choices=transfer.FORMATS)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        kind = transfer.KINDS[options['kind']]
+        path = options['path']
+        format = options['format'] or transfer.detect_format(path)
+        started = time.perf_counter()
+        written = 0
+        stream = (sys.stdout if path == '-'
+                  else open(path, 'w', newline='', encoding='utf-8'))
+        try:
+            writer = transfer.RowWriter(stream, format, kind.columns)
+            for row in kind.export_rows(options['batch_size']):
+                writer.write(row)
+                written += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        # При выгрузке в stdout отчёт не должен попасть в данные
+        self.stderr.write(
+            f'{options["kind"]}: выгружено {written} за {elapsed:.1f} с '
+            f'({written / max(elapsed, 1e-9):.0f} строк/с)'
+        )
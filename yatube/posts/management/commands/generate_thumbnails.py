@@ -0,0 +1,50 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from sorl.thumbnail import default
+
+from posts.models import Post
+from posts.paginator import iterate_in_batches
+from posts.thumbnails import THUMBNAIL_SIZES
+
+logger = logging.getLogger(__name__)
+
+
+def _generate(post):
+    try:
+        for geometry, options in THUMBNAIL_SIZES:
+            default.backend.generate(post.image.name, geometry, **options)
+        return True
+    except Exception:
+        logger.exception('Не удалось нарезать миниатюры поста %s', post.pk)
+        return False
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Заранее режет миниатюры картинок всех постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('image')
+        started = time.perf_counter()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            # В пуле не больше одной пачки: память не растёт с числом постов
+            for batch in iterate_in_batches(posts, options['batch_size']):
+                for ok in pool.map(_generate, batch):
+                    if ok:
+                        done += 1
+                    else:
+                        failed += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Готово: {done}, ошибок: {failed}, за {elapsed:.1f} с'
+        )
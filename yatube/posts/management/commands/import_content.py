@@ -0,0 +1,51 @@
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed_cache, transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает группы, посты, комментарии или подписки из '
+            'JSONL/CSV пачками через bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(transfer.KINDS))
+        parser.add_argument('path', help='Файл или - для stdin')
+        parser.add_argument('--format', choices=transfer.FORMATS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        kind = transfer.KINDS[options['kind']]
+        path = options['path']
+        format = options['format'] or transfer.detect_format(path)
+        started = time.perf_counter()
+        read = refreshing = 0
+        skipped = Counter()
+        stream = (sys.stdin if path == '-'
+                  else open(path, newline='', encoding='utf-8'))
+        with stream, transfer.preserved_dates():
+            rows = transfer.read_rows(stream, format)
+            for batch in transfer.batches(rows, options['batch_size']):
+                with transaction.atomic():
+                    objects = kind.save(batch, skipped)
+                    refreshed = time.perf_counter()
+                    scopes = kind.refresh(objects)
+                # Сброс после коммита: иначе читатель успеет закешировать
+                # старые данные под новой версией
+                feed_cache.bump(*scopes)
+                feed_cache.drop(*scopes)
+                refreshing += time.perf_counter() - refreshed
+                read += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{options["kind"]}: прочитано {read}, '
+            f'пропущено {sum(skipped.values())} '
+            f'за {elapsed:.1f} с ({read / max(elapsed, 1e-9):.0f} строк/с), '
+            f'из них ленты, счётчики и поиск {refreshing:.1f} с'
+        )
+        for reason, count in skipped.most_common():
+            self.stdout.write(f'  {reason}: {count}')
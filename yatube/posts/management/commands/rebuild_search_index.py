@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+from posts.paginator import iterate_in_batches
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        started = time.perf_counter()
+        backend.clear()
+        indexed = 0
+        posts = Post.objects.only('pk', 'text')
+        for batch in iterate_in_batches(posts, options['batch_size']):
+            with transaction.atomic():
+                backend.index(batch)
+            indexed += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{type(backend).__name__}: проиндексировано {indexed} постов '
+            f'за {elapsed:.1f} с'
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, подписок и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = counters.recount_users(batch_size)
+        posts = counters.recount_comments(batch_size)
+        self.stdout.write(
+            f'Исправлено счётчиков пользователей: {users}, постов: {posts}'
+        )
@@ -0,0 +1,165 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from faker import Faker
+from PIL import Image
+
+from posts import counters, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+# Объёмы при --scale 1
+USERS = 200
+GROUPS = 10
+POSTS = 2000
+COMMENTS = 5000
+FOLLOWS_PER_USER = 20
+BATCH_SIZE = 1000
+# Показатель степенного закона популярности: несколько авторов
+# собирают большую часть подписок и постов, как в живой базе
+POPULARITY_EXPONENT = 1.2
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими пользователями, группами, '
+            'постами с картинками, комментариями и подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--image-ratio', type=float, default=0.2,
+                            help='Доля постов с картинкой')
+        parser.add_argument('--images', type=int, default=20,
+                            help='Сколько разных картинок создать')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        self.random = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.create_users(self.volume(USERS, scale))
+            groups = self.create_groups(self.volume(GROUPS, scale))
+            weights = self.popularity(len(users))
+            posts = self.create_posts(
+                self.volume(POSTS, scale), users, weights, groups,
+                self.create_images(options['images']),
+                options['image_ratio'],
+            )
+            self.create_comments(self.volume(COMMENTS, scale), users, posts)
+            follows = self.create_follows(users, weights)
+        # bulk_create не шлёт сигналы: производные данные строятся
+        # так же, как после миграций и импорта
+        for user_id, author_id in follows:
+            timeline.backfill(user_id, author_id)
+        counters.recount_users(BATCH_SIZE)
+        counters.recount_comments(BATCH_SIZE)
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        cache.clear()
+        self.stdout.write(
+            f'Пользователей: {len(users)}, групп: {len(groups)}, '
+            f'постов: {len(posts)}, подписок: {len(follows)} '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+
+    @staticmethod
+    def volume(base, scale):
+        return max(1, int(base * scale))
+
+    def popularity(self, count):
+        """Веса пользователей по закону Ципфа в случайном порядке."""
+        weights = [1 / (rank + 1) ** POPULARITY_EXPONENT
+                   for rank in range(count)]
+        self.random.shuffle(weights)
+        return weights
+
+    def create_users(self, count):
+        first = User.objects.count()
+        password = make_password('password')
+        User.objects.bulk_create(
+            [User(username=f'{self.fake.user_name()}{first + i}',
+                  first_name=self.fake.first_name(),
+                  last_name=self.fake.last_name(),
+                  email=self.fake.email(),
+                  password=password)
+             for i in range(count)],
+            batch_size=BATCH_SIZE,
+        )
+        # SQLite не возвращает pk из bulk_create
+        return list(User.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:count])
+
+    def create_groups(self, count):
+        first = Group.objects.count()
+        Group.objects.bulk_create(
+            [Group(title=self.fake.catch_phrase(),
+                   slug=f'group-{first + i}',
+                   description=self.fake.paragraph())
+             for i in range(count)],
+            batch_size=BATCH_SIZE,
+        )
+        return list(Group.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:count])
+
+    def create_images(self, count):
+        names = []
+        for i in range(count):
+            image = Image.new('RGB', (960, 540), tuple(
+                self.random.randrange(256) for _ in range(3)))
+            content = io.BytesIO()
+            image.save(content, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/seed_{i}.jpg', ContentFile(content.getvalue())))
+        return names
+
+    def create_posts(self, count, users, weights, groups, images,
+                     image_ratio):
+        authors = self.random.choices(users, weights, k=count)
+        Post.objects.bulk_create(
+            [Post(author_id=author_id,
+                  text=self.fake.paragraph(nb_sentences=5),
+                  group_id=(self.random.choice(groups)
+                            if self.random.random() < 0.7 else None),
+                  image=(self.random.choice(images)
+                         if images and self.random.random() < image_ratio
+                         else ''))
+             for author_id in authors],
+            batch_size=BATCH_SIZE,
+        )
+        return list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:count])
+
+    def create_comments(self, count, users, posts):
+        # Комментарии, как и подписки, тянутся к свежим постам
+        post_weights = [1 / (rank + 1) for rank in range(len(posts))]
+        Comment.objects.bulk_create(
+            [Comment(post_id=post_id,
+                     author_id=self.random.choice(users),
+                     text=self.fake.sentence())
+             for post_id in self.random.choices(posts, post_weights,
+                                                k=count)],
+            batch_size=BATCH_SIZE,
+        )
+
+    def create_follows(self, users, weights):
+        pairs = set()
+        for user_id in users:
+            wanted = int(self.random.expovariate(1 / FOLLOWS_PER_USER))
+            for author_id in self.random.choices(users, weights, k=wanted):
+                if author_id != user_id:
+                    pairs.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return pairs
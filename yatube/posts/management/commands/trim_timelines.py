@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts import timeline
+from posts.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Обрезает ленты подписок до TIMELINE_MAX_LENGTH записей'
+
+    def handle(self, *args, **options):
+        user_ids = TimelineEntry.objects.values('user_id').annotate(
+            entries=Count('id')
+        ).filter(
+            entries__gt=settings.TIMELINE_MAX_LENGTH
+        ).values_list('user_id', flat=True)
+        trimmed = 0
+        for user_id in user_ids.iterator():
+            timeline.trim(user_id)
+            trimmed += 1
+        self.stdout.write(f'Обрезано лент: {trimmed}')
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации «на кого подписаться»; по '
+            'умолчанию только для пользователей с изменёнными подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать всех пользователей')
+        parser.add_argument('--batch-size', type=int,
+                            default=recommendations.IN_CHUNK)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = recommendations.update(options['full'],
+                                         options['batch_size'])
+        self.stdout.write(
+            f'Рекомендации пересчитаны для {updated} пользователей '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
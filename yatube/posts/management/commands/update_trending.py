@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Сбрасывает счётчики активности в базу и пересчитывает '
+            'рейтинг популярного; запускается раз в минуту')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Повторять каждые 60 секунд')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            trending.flush()
+            ranking = trending.compute()
+            self.stdout.write(
+                f'Популярное: постов {len(ranking["posts"])}, групп '
+                f'{len(ranking["groups"])} за '
+                f'{time.perf_counter() - started:.2f} с'
+            )
+            if not options['loop']:
+                return
+            time.sleep(60)
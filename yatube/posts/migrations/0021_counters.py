@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _counts(queryset, field):
+    return dict(queryset.order_by().values(field)
+                .annotate(total=Count('pk'))
+                .values_list(field, 'total'))
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    posts = _counts(Post.objects, 'author')
+    followers = _counts(Follow.objects, 'author')
+    following = _counts(Follow.objects, 'user')
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=pk,
+                      posts=posts.get(pk, 0),
+                      followers=followers.get(pk, 0),
+                      following=following.get(pk, 0))
+         for pk in User.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+    comments = Comment.objects.filter(post=OuterRef('pk')).values(
+        'post').annotate(total=Count('pk')).values('total')
+    Post.objects.update(comments_count=Coalesce(Subquery(comments), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0020_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.IntegerField(default=0)),
+                ('followers', models.IntegerField(default=0)),
+                ('following', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
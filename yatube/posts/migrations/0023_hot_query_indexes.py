@@ -0,0 +1,64 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:13
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+BATCH_SIZE = 1000
+
+
+def deduplicate_follows(apps, schema_editor):
+    """Оставляет по одной подписке на пару (user, author), поправляя
+    счётчики на число удалённых дублей.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    while True:
+        duplicates = list(
+            Follow.objects.values('user_id', 'author_id')
+            .annotate(total=Count('id'), keep=Min('id'))
+            .filter(total__gt=1)
+            .order_by()[:BATCH_SIZE]
+        )
+        if not duplicates:
+            return
+        for row in duplicates:
+            Follow.objects.filter(
+                user_id=row['user_id'], author_id=row['author_id']
+            ).exclude(id=row['keep']).delete()
+            removed = row['total'] - 1
+            UserCounters.objects.filter(user_id=row['author_id']).update(
+                followers=F('followers') - removed)
+            UserCounters.objects.filter(user_id=row['user_id']).update(
+                following=F('following') - removed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date'),
+        ),
+        migrations.RunPython(deduplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
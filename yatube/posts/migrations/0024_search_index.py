@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    """На SQLite с FTS5 индекс ведёт сама база; иначе используется
+    таблица SearchTerm, её заполняет команда rebuild_search_index.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pragma_compile_options "
+            "WHERE compile_options = 'ENABLE_FTS5'"
+        )
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+            f"USING fts5(text, tokenize='unicode61')"
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) '
+            f'SELECT id, text FROM posts_post'
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.IntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_term'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Пост'), ('group', 'Группа')], max_length=5)),
+                ('object_id', models.IntegerField()),
+                ('bucket', models.IntegerField()),
+                ('count', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='activitybucket',
+            index=models.Index(fields=['bucket'], name='activity_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='activitybucket',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id', 'bucket'), name='unique_activity_bucket'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0028_timeline_index_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stalerecommendations',
+            name='marked',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
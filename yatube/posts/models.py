@@ -3,11 +3,28 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 CUT = 15
+LISTING_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__slug',
+    'group__title',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Автор и группа одним запросом, только поля карточки поста."""
+        return self.select_related('author', 'group').only(*LISTING_FIELDS)
 
 
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='posts',
@@ -25,11 +42,22 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.IntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_id'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:CUT]
@@ -64,6 +92,12 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=('post', 'created'),
+                         name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User,
@@ -75,3 +109,144 @@ class Follow(models.Model):
                                related_name='following',
                                on_delete=models.CASCADE
                                )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(User,
+                             related_name='timeline',
+                             on_delete=models.CASCADE,
+                             )
+    post = models.ForeignKey(Post,
+                             related_name='timeline_entries',
+                             on_delete=models.CASCADE,
+                             )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_post'),
+        ]
+
+
+class UserCounters(models.Model):
+    """Денормализованные счётчики постов и подписок пользователя."""
+    user = models.OneToOneField(User,
+                                primary_key=True,
+                                related_name='counters',
+                                on_delete=models.CASCADE,
+                                )
+    posts = models.IntegerField(default=0)
+    followers = models.IntegerField(default=0)
+    following = models.IntegerField(default=0)
+
+
+class SearchTerm(models.Model):
+    """Обратный индекс поиска по постам, когда в базе нет FTS5."""
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post,
+                             related_name='search_terms',
+                             on_delete=models.CASCADE,
+                             )
+    weight = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('term', 'post'),
+                                    name='unique_search_term'),
+        ]
+
+
+class Recommendation(models.Model):
+    """Автор, на которого стоит подписаться, по расчёту
+    update_recommendations.
+    """
+    user = models.ForeignKey(User,
+                             related_name='recommendations',
+                             on_delete=models.CASCADE,
+                             )
+    candidate = models.ForeignKey(User,
+                                  related_name='+',
+                                  on_delete=models.CASCADE,
+                                  )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'candidate'),
+                                    name='unique_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-score'),
+                         name='recommendation_user_score'),
+        ]
+
+
+class StaleRecommendations(models.Model):
+    """Пользователь, чьи подписки изменились после последнего расчёта."""
+    user = models.OneToOneField(User,
+                                primary_key=True,
+                                related_name='+',
+                                on_delete=models.CASCADE,
+                                )
+    # Время последней отметки: расчёт снимает только отметки, старше
+    # своего начала, и новая подписка во время расчёта не теряется
+    marked = models.DateTimeField(auto_now=True)
+
+
+class ActivityBucket(models.Model):
+    """Число событий объекта за интервал trending.BUCKET_SECONDS:
+    комментариев к посту или новых постов в группе.
+    """
+    POST = 'post'
+    GROUP = 'group'
+    KINDS = ((POST, 'Пост'), (GROUP, 'Группа'))
+
+    kind = models.CharField(max_length=5, choices=KINDS)
+    object_id = models.IntegerField()
+    bucket = models.IntegerField()
+    count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('kind', 'object_id', 'bucket'),
+                                    name='unique_activity_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=('bucket',), name='activity_bucket'),
+        ]
+
+
+class Notification(models.Model):
+    """Уведомление подписчика о новом посте автора."""
+    user = models.ForeignKey(User,
+                             related_name='notifications',
+                             on_delete=models.CASCADE,
+                             )
+    post = models.ForeignKey(Post,
+                             related_name='+',
+                             on_delete=models.CASCADE,
+                             )
+    created = models.DateTimeField(auto_now_add=True)
+    read = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_notification'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-created'),
+                         name='notification_user_created'),
+        ]
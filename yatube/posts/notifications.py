@@ -0,0 +1,88 @@
+"""Уведомления подписчиков о новых постах.
+
+Рассылка идёт очередью задач: каждая задача берёт FOLLOWERS_CHUNK
+подписок автора по возрастанию id, пишет их уведомления одним
+bulk_create и ставит следующую. Число непрочитанных живёт в кеше и
+только сдвигается; из базы оно считается, лишь когда ключа нет.
+Ключ живёт UNREAD_TIMEOUT: подсчёт, записанный после рассылки, которая
+его не застала, устаревает ненадолго.
+"""
+from django.core.cache import cache
+
+from core import jobs
+from .models import Follow, Notification, Post
+
+FOLLOWERS_CHUNK = 1000
+SHOWN = 50
+UNREAD_TIMEOUT = 60 * 5
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def schedule(post):
+    """Ставит рассылку в транзакции, создавшей пост."""
+    jobs.enqueue(deliver, post.pk, post.author_id, 0,
+                 key=f'notifications:{post.pk}:0')
+
+
+@jobs.task
+def deliver(post_id, author_id, after):
+    """Уведомляет подписчиков с id подписки больше after."""
+    if not Post.objects.filter(pk=post_id).exists():
+        # Пост удалили раньше, чем дошла очередь
+        return
+    follows = list(Follow.objects.filter(
+        author_id=author_id, pk__gt=after
+    ).order_by('pk').values_list('pk', 'user_id')[:FOLLOWERS_CHUNK])
+    if not follows:
+        return
+    user_ids = [user_id for _, user_id in follows]
+    # Повтор упавшей задачи не должен второй раз сдвигать счётчики
+    notified = set(Notification.objects.filter(
+        post_id=post_id, user_id__in=user_ids
+    ).values_list('user_id', flat=True))
+    fresh = [user_id for user_id in user_ids if user_id not in notified]
+    Notification.objects.bulk_create(
+        [Notification(user_id=user_id, post_id=post_id)
+         for user_id in fresh],
+        ignore_conflicts=True,
+    )
+    cached = cache.get_many([_unread_key(user_id) for user_id in fresh])
+    for key in cached:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+    if len(follows) == FOLLOWERS_CHUNK:
+        last = follows[-1][0]
+        jobs.enqueue(deliver, post_id, author_id, last,
+                     key=f'notifications:{post_id}:{last}')
+
+
+def cached_unread(user_id):
+    """Число непрочитанных из кеша или None; без запросов к базе."""
+    return cache.get(_unread_key(user_id))
+
+
+def unread_count(user):
+    count = cached_unread(user.pk)
+    if count is None:
+        # Счётчик ляжет в общий кеш: реплика могла ещё не увидеть
+        # новые уведомления
+        count = Notification.objects.using('default').filter(
+            user=user, read=False).count()
+        cache.add(_unread_key(user.pk), count, UNREAD_TIMEOUT)
+    return count
+
+
+def latest(user):
+    return list(Notification.objects.filter(user=user)
+                .select_related('post__author')
+                .order_by('-created', '-pk')[:SHOWN])
+
+
+def mark_read(user):
+    Notification.objects.filter(user=user, read=False).update(read=True)
+    cache.set(_unread_key(user.pk), 0, UNREAD_TIMEOUT)
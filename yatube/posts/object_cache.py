@@ -0,0 +1,145 @@
+"""Кеш объектов Post, Group и User с чтением через кеш.
+
+Объект лежит под первичным ключом, а естественный ключ (slug,
+username, в ключе — его хеш) указывает на первичный. Сохранение и
+удаление сбрасывают ключи объекта сигналами — сразу и ещё раз после
+коммита; устаревшая ссылка по естественному ключу после
+переименования отбрасывается сверкой поля. Промахи читаются с основной
+базы и во вьюхах read_from_replica: отстающая реплика вернула бы в кеш
+строку до правки на весь TIMEOUT. Попадания и промахи считаются в
+core.timing и попадают в Server-Timing и лог запроса.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from core import timing
+from .models import Group, Post, User
+
+TIMEOUT = 60 * 60
+NATURAL_KEYS = {
+    Post: (),
+    Group: ('slug',),
+    User: ('username',),
+}
+# Связанные объекты, которые загружаются тем же запросом и кладутся в
+# кеш отдельно: в кешированном посте автора нет, иначе правка автора
+# его бы не сбросила
+RELATED = {
+    Post: ('author', 'group'),
+}
+# Только поля, которые выводят страницы: хеш пароля и почта в общий
+# кеш не попадают
+FIELDS = {
+    Post: ('text', 'pub_date', 'image', 'author', 'group', 'comments_count'),
+    Group: ('title', 'slug', 'description'),
+    User: ('username', 'first_name', 'last_name'),
+}
+
+
+def _key(model, field, value):
+    if field != 'pk':
+        # Слаг или имя могут содержать пробелы и кириллицу
+        value = hashlib.md5(str(value).encode()).hexdigest()
+    return f'object:{model._meta.label_lower}:{field}:{value}'
+
+
+def _queryset(model):
+    related = RELATED.get(model, ())
+    fields = list(FIELDS[model])
+    for name in related:
+        remote = model._meta.get_field(name).related_model
+        fields.extend(f'{name}__{field}' for field in FIELDS[remote])
+    return model.objects.using('default').select_related(
+        *related).only(*fields)
+
+
+def get_many(model, pks):
+    """{pk: объект} для найденных в базе."""
+    keys = {_key(model, 'pk', pk): pk for pk in set(pks)}
+    objects = {keys[key]: obj for key, obj in cache.get_many(keys).items()}
+    missing = [pk for pk in keys.values() if pk not in objects]
+    timing.count('object_cache_hit', len(objects))
+    timing.count('object_cache_miss', len(missing))
+    if missing:
+        loaded = _queryset(model).in_bulk(missing)
+        cache.set_many(_entries(model, loaded.values()), TIMEOUT)
+        objects.update(loaded)
+    return objects
+
+
+def _entries(model, objects):
+    entries = {}
+    for obj in objects:
+        for name in RELATED.get(model, ()):
+            field = model._meta.get_field(name)
+            related = field.get_cached_value(obj, None)
+            field.delete_cached_value(obj)
+            if related is not None:
+                entries[_key(type(related), 'pk', related.pk)] = related
+        entries[_key(model, 'pk', obj.pk)] = obj
+    return entries
+
+
+def get(model, **lookup):
+    """Объект по pk или естественному ключу, например
+    get(User, username='leo'); нет в базе — model.DoesNotExist.
+    """
+    [(field, value)] = lookup.items()
+    if field in ('pk', 'id'):
+        obj = get_many(model, [value]).get(value)
+        if obj is None:
+            raise model.DoesNotExist
+        return obj
+    if field not in NATURAL_KEYS[model]:
+        raise ValueError(f'{field} не естественный ключ {model.__name__}')
+    pk = cache.get(_key(model, field, value))
+    if pk is not None:
+        obj = get_many(model, [pk]).get(pk)
+        if obj is not None and getattr(obj, field) == value:
+            return obj
+    else:
+        timing.count('object_cache_miss')
+    obj = _queryset(model).get(**{field: value})
+    cache.set_many({_key(model, field, value): obj.pk,
+                    _key(model, 'pk', obj.pk): obj}, TIMEOUT)
+    return obj
+
+
+def get_or_404(model, **lookup):
+    try:
+        return get(model, **lookup)
+    except model.DoesNotExist:
+        raise Http404(f'{model._meta.object_name} не найден')
+
+
+def get_post(post_id):
+    """Пост с автором и группой из кеша; нет поста — Http404."""
+    post = get_or_404(Post, pk=post_id)
+    post.author = get(User, pk=post.author_id)
+    if post.group_id is not None:
+        post.group = get(Group, pk=post.group_id)
+    return post
+
+
+def _delete(keys):
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        # До коммита читатель видит старую строку и может вернуть её в
+        # кеш на TIMEOUT: после коммита ключи удаляются ещё раз
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate(model, pks):
+    _delete([_key(model, 'pk', pk) for pk in pks])
+
+
+def invalidate_instance(instance):
+    model = type(instance)
+    _delete(
+        [_key(model, 'pk', instance.pk)]
+        + [_key(model, field, getattr(instance, field))
+           for field in NATURAL_KEYS[model]]
+    )
@@ -0,0 +1,204 @@
+import base64
+import binascii
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который берёт число записей из кеша.
+
+    COUNT(*) по ленте выполняется раз в PAGINATOR_COUNT_TIMEOUT секунд
+    на ключ count_key, а не на каждый запрос; число страниц может
+    ненадолго отставать от ленты.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        key = f'paginator_count:{self.count_key}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+
+class CursorPaginator(CachedCountPaginator):
+    """Keyset-пагинация по паре полей (по умолчанию pub_date, id).
+
+    Страница выбирается условием WHERE по ключу последней показанной
+    записи, поэтому не нужны ни COUNT(*), ни OFFSET. Номерные страницы
+    (старые ссылки ?page=N) по-прежнему обслуживает get_page().
+    """
+
+    def __init__(self, object_list, per_page, fields=('pub_date', 'id'),
+                 descending=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.fields = fields
+        self.descending = descending
+
+    def cursor_page(self, cursor=None):
+        direction, key = self.decode_cursor(cursor)
+        backwards = direction == PREVIOUS and key is not None
+        queryset = self.object_list
+        if key is not None:
+            queryset = queryset.filter(self._beyond(key, backwards))
+        descending = self.descending != backwards
+        ordering = [f'-{f}' if descending else f for f in self.fields]
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            if not has_more:
+                # До начала ленты меньше страницы: показываем первую целиком
+                return self.cursor_page()
+            rows.reverse()
+            has_previous, has_next = True, True
+        else:
+            has_previous, has_next = key is not None, has_more
+        page = Page(rows, 1, self)
+        page.is_keyset = True
+        page.previous_cursor = (
+            self.encode_cursor(PREVIOUS, rows[0])
+            if has_previous and rows else None
+        )
+        page.next_cursor = (
+            self.encode_cursor(NEXT, rows[-1]) if has_next and rows else None
+        )
+        return page
+
+    def _beyond(self, key, backwards):
+        """Условие «после ключа» в порядке обхода ленты."""
+        first, second = self.fields
+        lookup = 'lt' if self.descending != backwards else 'gt'
+        return (
+            Q(**{f'{first}__{lookup}': key[0]})
+            | Q(**{first: key[0], f'{second}__{lookup}': key[1]})
+        )
+
+    def encode_cursor(self, direction, obj):
+        raw = '|'.join(
+            [direction] + [str(getattr(obj, f)) for f in self.fields]
+        )
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Разбирает токен; испорченный токен означает первую страницу."""
+        if not cursor:
+            return NEXT, None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, *values = raw.split('|')
+            model = self.object_list.model
+            key = tuple(
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            )
+        except (binascii.Error, UnicodeDecodeError, ValueError,
+                ValidationError):
+            return NEXT, None
+        if direction not in (NEXT, PREVIOUS) or len(key) != 2:
+            return NEXT, None
+        return direction, key
+
+
+# Ниже этого числа строк точный COUNT(*) дешевле, чем неточность оценки
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimated_count(model, using):
+    """Число строк таблицы по статистике СУБД или None, если её нет."""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+    elif connection.vendor == 'sqlite':
+        # Заполняется ANALYZE (и PRAGMA optimize); первое число — строки
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    return int(str(row[0]).split()[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для админки на больших таблицах.
+
+    Без фильтров число записей берётся из статистики СУБД, с фильтрами —
+    точный COUNT(*), закешированный по тексту запроса. Страница сначала
+    выбирается по индексу первичных ключей, и только её строки читаются
+    целиком вместе с JOIN.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        key = f'paginator_count:admin:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        if bottom == 0:
+            return super().page(number)
+        ids = list(self.object_list.values_list('pk', flat=True)[
+            bottom:bottom + self.per_page])
+        return self._get_page(self.object_list.filter(pk__in=ids), number,
+                              self)
+
+
+def paginate(request, object_list, per_page, paginator=None):
+    """Страница ленты по ?cursor=; старые ссылки ?page=N тоже работают."""
+    paginator = paginator or CursorPaginator(object_list, per_page)
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        return paginator.get_page(page_number)
+    return paginator.cursor_page(request.GET.get('cursor'))
+
+
+def iterate_in_batches(queryset, batch_size):
+    """Пачки объектов по возрастанию pk без OFFSET."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
@@ -0,0 +1,208 @@
+"""Рекомендации «на кого подписаться»: друзья друзей и общие группы.
+
+Граф подписок загружается потоком в разреженные массивы CSR из модуля
+array: indptr длиной в число пользователей и indices длиной в число
+рёбер, по 4 байта на подписку. Кандидат получает MUTUAL_WEIGHT за каждого
+автора из подписок пользователя, который на него подписан, и
+GROUP_WEIGHT за каждую общую группу, где оба писали.
+"""
+import heapq
+from array import array
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import feed_cache
+from .models import (Follow, Post, Recommendation, StaleRecommendations,
+                     User)
+from .paginator import iterate_in_batches
+
+TOP_K = 10
+MUTUAL_WEIGHT = 1.0
+GROUP_WEIGHT = 0.5
+# Сколько соседей смотреть у одной вершины: знаменитость с сотнями
+# тысяч подписок не должна раздувать расчёт
+MAX_NEIGHBOURS = 1000
+STREAM_CHUNK = 10000
+# Не больше параметров в одном IN, чем позволяет SQLite
+IN_CHUNK = 500
+SHOWN = 5
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class CSR:
+    """Строки разреженной матрицы смежности в двух плоских массивах."""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_sorted_pairs(cls, pairs, rows):
+        """Строит матрицу из пар (строка, столбец), упорядоченных по
+        строке, не держа сами пары в памяти.
+        """
+        indptr = array('l', [0]) * (rows + 1)
+        indices = array('i')
+        for row, column in pairs:
+            indices.append(column)
+            indptr[row + 1] += 1
+        for row in range(rows):
+            indptr[row + 1] += indptr[row]
+        return cls(indptr, indices)
+
+    @property
+    def rows(self):
+        return len(self.indptr) - 1
+
+    def row(self, index):
+        if not 0 <= index < self.rows:
+            return self.indices[0:0]
+        start = self.indptr[index]
+        return self.indices[start:start + min(
+            self.indptr[index + 1] - start, MAX_NEIGHBOURS)]
+
+    @property
+    def nbytes(self):
+        return (len(self.indptr) * self.indptr.itemsize
+                + len(self.indices) * self.indices.itemsize)
+
+
+def _stream(queryset):
+    return queryset.iterator(chunk_size=STREAM_CHUNK)
+
+
+def load_graphs():
+    """Подписки, группы авторов и авторы групп в виде CSR."""
+    rows = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    follows = CSR.from_sorted_pairs(_stream(
+        Follow.objects.order_by('user_id', 'author_id')
+        .values_list('user_id', 'author_id')), rows)
+    memberships = (Post.objects.filter(group__isnull=False)
+                   .values_list('author_id', 'group_id').distinct())
+    groups = CSR.from_sorted_pairs(
+        _stream(memberships.order_by('author_id', 'group_id')), rows)
+    group_rows = (Post.objects.aggregate(last=Max('group_id'))['last']
+                  or 0) + 1
+    members = CSR.from_sorted_pairs(_stream(
+        memberships.order_by('group_id', 'author_id')
+        .values_list('group_id', 'author_id')), group_rows)
+    return follows, groups, members
+
+
+def score(user_id, follows, groups, members):
+    """Лучшие TOP_K кандидатов пользователя: [(кандидат, балл)]."""
+    followed = follows.row(user_id)
+    scores = Counter()
+    for author_id in followed:
+        for candidate in follows.row(author_id):
+            scores[candidate] += MUTUAL_WEIGHT
+    for group_id in groups.row(user_id):
+        for candidate in members.row(group_id):
+            scores[candidate] += GROUP_WEIGHT
+    scores.pop(user_id, None)
+    for author_id in set(followed):
+        scores.pop(author_id, None)
+    return heapq.nlargest(TOP_K, scores.items(),
+                          key=lambda item: (item[1], -item[0]))
+
+
+def _cache_key(user_id):
+    return f'who_to_follow:{user_id}'
+
+
+def store(results):
+    """Заменяет рекомендации пользователей {user_id: [(id, балл)]}."""
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=list(results)).delete()
+        Recommendation.objects.bulk_create(
+            Recommendation(user_id=user_id, candidate_id=candidate,
+                           score=points)
+            for user_id, top in results.items()
+            for candidate, points in top
+        )
+    cache.delete_many([_cache_key(user_id) for user_id in results])
+    feed_cache.bump(*(f'recommendations:{user_id}' for user_id in results))
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CHUNK):
+        yield ids[start:start + IN_CHUNK]
+
+
+def affected_users(changed):
+    """Пользователи с изменёнными подписками и их подписчики: у
+    последних поменялись друзья друзей.
+    """
+    users = set(changed)
+    for chunk in _chunks(changed):
+        users.update(Follow.objects.filter(author_id__in=chunk)
+                     .values_list('user_id', flat=True))
+    return users
+
+
+def update(full=False, batch_size=IN_CHUNK):
+    """Пересчитывает рекомендации всех или только затронутых
+    пользователей; возвращает число пересчитанных.
+    """
+    # Отметки, появившиеся или обновлённые во время расчёта, останутся
+    # до следующего
+    started = timezone.now()
+    changed = list(StaleRecommendations.objects.values_list(
+        'user_id', flat=True))
+    if not full:
+        users = affected_users(changed)
+        if not users:
+            return 0
+    graphs = load_graphs()
+    if full:
+        batches = ([user.pk for user in batch] for batch in
+                   iterate_in_batches(User.objects.only('pk'), batch_size))
+    else:
+        users = sorted(users)
+        batches = (users[start:start + batch_size]
+                   for start in range(0, len(users), batch_size))
+    updated = 0
+    for batch in batches:
+        store({user_id: score(user_id, *graphs) for user_id in batch})
+        updated += len(batch)
+    for chunk in _chunks(changed):
+        StaleRecommendations.objects.filter(
+            user_id__in=chunk, marked__lt=started).delete()
+    return updated
+
+
+def mark_stale(user_id):
+    """Ставит пользователя в очередь пересчёта после смены подписок."""
+    now = timezone.now()
+    if not StaleRecommendations.objects.filter(user_id=user_id).update(
+            marked=now):
+        StaleRecommendations.objects.bulk_create(
+            [StaleRecommendations(user_id=user_id, marked=now)],
+            ignore_conflicts=True)
+    cache.delete(_cache_key(user_id))
+
+
+def for_user(user):
+    """Кого показать пользователю в блоке «на кого подписаться»."""
+    if not user.is_authenticated:
+        return []
+    key = _cache_key(user.pk)
+    shown = cache.get(key)
+    if shown is None:
+        shown = [
+            {'username': username,
+             'name': f'{first_name} {last_name}'.strip() or username}
+            for username, first_name, last_name in
+            Recommendation.objects.filter(user=user)
+            .exclude(candidate__following__user=user)
+            .order_by('-score').values_list(
+                'candidate__username', 'candidate__first_name',
+                'candidate__last_name')[:SHOWN]
+        ]
+        cache.set(key, shown, CACHE_TIMEOUT)
+    return shown
@@ -0,0 +1,140 @@
+import re
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Count, Sum
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'posts_post_fts'
+WORD = re.compile(r'\w+')
+MAX_TERM_LENGTH = SearchTerm._meta.get_field('term').max_length
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in WORD.findall(text.lower())]
+
+
+class FTS5Backend:
+    """Полнотекстовый индекс SQLite FTS5 с ранжированием bm25."""
+
+    def index(self, posts):
+        rows = [(post.pk, post.text) for post in posts]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk, _ in rows],
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+            )
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in post_ids],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    @staticmethod
+    def _match(terms):
+        # Каждое слово в кавычках, чтобы ввод не разбирался как синтаксис
+        # FTS5; последнее слово ищется по префиксу
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def count(self, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self._match(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def ids(self, terms, offset, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [self._match(terms), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TermTableBackend:
+    """Обратный индекс в таблице SearchTerm для баз без FTS5.
+
+    Вес слова — число его вхождений в текст поста; находятся посты,
+    где есть все слова запроса, выше — с большим суммарным весом.
+    """
+
+    def index(self, posts):
+        posts = list(posts)
+        self.remove(post.pk for post in posts)
+        SearchTerm.objects.bulk_create(
+            (SearchTerm(term=term, post_id=post.pk, weight=weight)
+             for post in posts
+             for term, weight in Counter(tokenize(post.text)).items()),
+            batch_size=1000,
+        )
+
+    def remove(self, post_ids):
+        SearchTerm.objects.filter(post_id__in=list(post_ids)).delete()
+
+    def clear(self):
+        SearchTerm.objects.all().delete()
+
+    def _matches(self, terms):
+        return (
+            SearchTerm.objects.filter(term__in=set(terms))
+            .values('post_id')
+            .annotate(matched=Count('term'), score=Sum('weight'))
+            .filter(matched=len(set(terms)))
+        )
+
+    def count(self, terms):
+        return self._matches(terms).count()
+
+    def ids(self, terms, offset, limit):
+        matches = self._matches(terms).order_by('-score', '-post_id')
+        return list(
+            matches.values_list('post_id', flat=True)[offset:offset + limit]
+        )
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if FTS_TABLE in connection.introspection.table_names():
+            _backend = FTS5Backend()
+        else:
+            _backend = TermTableBackend()
+    return _backend
+
+
+class SearchResults:
+    """Ленивый ранжированный результат поиска для Paginator."""
+
+    def __init__(self, query):
+        self.terms = tokenize(query)
+
+    def count(self):
+        if not self.terms:
+            return 0
+        return get_backend().count(self.terms)
+
+    def __getitem__(self, item):
+        if not self.terms:
+            return []
+        ids = get_backend().ids(self.terms, item.start, item.stop - item.start)
+        posts = Post.objects.for_listing().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
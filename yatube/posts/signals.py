@@ -0,0 +1,213 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (counters, feed_cache, notifications, object_cache,
+               recommendations, search, thumbnails, timeline, trending)
+from .models import ActivityBucket, Comment, Follow, Group, Post, User
+
+
+def _on_commit(func, *args):
+    """Кеш лент меняется после коммита: иначе читатель успеет собрать
+    ленту по снимку без записи и закешировать её под новой версией.
+    """
+    transaction.on_commit(partial(func, *args))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if not created:
+        return
+    timeline.schedule(instance)
+    scopes = ['index', f'profile:{instance.author_id}']
+    if instance.group_id:
+        scopes.append(f'group:{instance.group_id}')
+    _on_commit(feed_cache.prepend, instance.pk, *scopes)
+
+
+@receiver(post_save, sender=Post)
+def notify_followers(sender, instance, created, **kwargs):
+    if created:
+        notifications.schedule(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance.author_id, posts=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(instance.author_id, posts=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance.author_id, followers=1)
+        counters.change(instance.user_id, following=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change(instance.author_id, followers=-1)
+    counters.change(instance.user_id, following=-1)
+
+
+def _post_scopes(post):
+    return ('index', f'profile:{post.author_id}', f'group:{post.group_id}',
+            f'post:{post.pk}')
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, created, **kwargs):
+    previous_group = f'group:{getattr(instance, "_previous_group_id", None)}'
+    _on_commit(feed_cache.bump, *_post_scopes(instance), previous_group)
+    if not created and previous_group != f'group:{instance.group_id}':
+        # Пост переехал: новое место в ленте группы — не её голова
+        _on_commit(feed_cache.drop, previous_group,
+                   f'group:{instance.group_id}')
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    _on_commit(feed_cache.bump, *_post_scopes(instance))
+    _on_commit(feed_cache.drop, *_post_scopes(instance)[:3])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, **kwargs):
+    _on_commit(feed_cache.bump, f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, **kwargs):
+    _on_commit(feed_cache.bump, f'follow:{instance.user_id}',
+               f'counters:{instance.user_id}',
+               f'counters:{instance.author_id}')
+    _on_commit(feed_cache.drop, f'follow:{instance.user_id}')
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, created, **kwargs):
+    if created:
+        return
+    # Название и адрес группы есть в карточках её постов: на главной,
+    # в ленте подписок (её ETag включает index) и в профилях авторов,
+    # а через профиль — на страницах самих постов
+    authors = Post.objects.filter(group=instance).order_by().values_list(
+        'author_id', flat=True).distinct()
+    _on_commit(feed_cache.bump, 'index', f'group:{instance.pk}',
+               *(f'profile:{author_id}' for author_id in authors))
+
+
+# Поля пользователя, которые выводятся на страницах; вход в систему,
+# смена пароля и правки в админке без них ETag не меняют
+USER_DISPLAY_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _display_fields_saved(update_fields):
+    return update_fields is None or bool(
+        set(USER_DISPLAY_FIELDS) & set(update_fields))
+
+
+@receiver(pre_save, sender=User)
+def remember_display_fields(sender, instance, update_fields, **kwargs):
+    if instance.pk is not None and _display_fields_saved(update_fields):
+        instance._previous_display = User.objects.filter(
+            pk=instance.pk).values_list(*USER_DISPLAY_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, created, update_fields,
+                          **kwargs):
+    if created or not _display_fields_saved(update_fields):
+        return
+    display = tuple(getattr(instance, field) for field in USER_DISPLAY_FIELDS)
+    if getattr(instance, '_previous_display', None) == display:
+        return
+    groups = Post.objects.filter(
+        author=instance, group__isnull=False
+    ).order_by().values_list('group_id', flat=True).distinct()
+    commented = Comment.objects.filter(author=instance).order_by() \
+        .values_list('post_id', flat=True).distinct()
+    _on_commit(feed_cache.bump, 'index', f'profile:{instance.pk}',
+               *(f'group:{group_id}' for group_id in groups),
+               *(f'post:{post_id}' for post_id in commented))
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(sender, instance, **kwargs):
+    thumbnails.pregenerate(instance.image)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def mark_recommendations_stale(sender, instance, **kwargs):
+    recommendations.mark_stale(instance.user_id)
+
+
+@receiver(post_save, sender=Comment)
+def record_post_activity(sender, instance, created, **kwargs):
+    if created:
+        trending.record(ActivityBucket.POST, instance.post_id)
+
+
+@receiver(post_save, sender=Post)
+def record_group_activity(sender, instance, created, **kwargs):
+    if created and instance.group_id:
+        trending.record(ActivityBucket.GROUP, instance.group_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def invalidate_cached_object(sender, instance, **kwargs):
+    object_cache.invalidate_instance(instance)
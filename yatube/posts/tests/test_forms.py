@@ -1,18 +1,20 @@
 import tempfile
 import shutil
+from unittest import mock
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.conf import settings
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.cache import cache
 
+from core.models import Job
 from posts.models import Post, Group, Comment
 
 User = get_user_model()
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -100,7 +102,31 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.get(id=self.post.id).text,
                          'Отредактированный тестовый пост')
 
+    def test_post_and_its_jobs_saved_in_one_transaction(self):
+        '''Сбой постановки задачи откатывает и пост, и его задачи'''
+        jobs = Job.objects.count()
+        with mock.patch('posts.notifications.schedule',
+                        side_effect=RuntimeError('сбой')), \
+                self.assertRaises(RuntimeError):
+            self.authorized_client.post(reverse('posts:post_create'),
+                                        data={'text': 'Потерянный'})
+        self.assertFalse(Post.objects.filter(text='Потерянный').exists())
+        self.assertEqual(Job.objects.count(), jobs)
 
+    def test_edit_keeps_fields_changed_behind_cache(self):
+        '''Правка не затирает поля, изменённые в базе мимо кеша'''
+        self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        Post.objects.filter(pk=self.post.pk).update(comments_count=7)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Правка'},
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.text, post.comments_count), ('Правка', 7))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class CommentFormTest(TestCase):
     @classmethod
     def setUpClass(cls):
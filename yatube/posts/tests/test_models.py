@@ -1,7 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Follow, Group, Post
 
 User = get_user_model()
 
@@ -39,3 +40,17 @@ class PostModelTest(TestCase):
         self.assertEqual(
             post._meta.get_field('group').help_text,
             'Группы, к которой относится пост')
+
+
+class FollowModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на того же автора отвергается базой"""
+        Follow.objects.create(user=self.user, author=self.author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user, author=self.author)
@@ -1,16 +1,39 @@
+import json
+import os
 import tempfile
+import time
+import warnings
+from io import StringIO
+from unittest import mock
 import shutil
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
-from posts.models import Post, Group, Comment, Follow
-from django.conf import settings
+from posts import (feed_cache, notifications, object_cache, recommendations,
+                   search, trending)
+from posts.paginator import EstimatedCountPaginator
+from posts.models import (Post, Group, Comment, Follow, TimelineEntry,
+                          UserCounters, ActivityBucket, Notification,
+                          StaleRecommendations)
 from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from core import jobs, routers
+from core.models import Job
 
 User = get_user_model()
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def run_jobs():
+    """Выполняет очередь задач до конца, как это сделал бы run_jobs."""
+    while jobs.work('worker') != (0, 0):
+        pass
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -167,16 +190,97 @@ class PostViewsTests(TestCase):
                 self.assertIsInstance(form_field, expected)
 
     def test_cache_index_page(self):
-        """Проверка кеширования на главной странице"""
-        Post.objects.create(
+        """Карточка поста кешируется до изменения поста"""
+        post = Post.objects.create(
             author=self.user,
             text='Проверка кеширования',
         )
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=post.pk).update(text='Обход кеша')
         response = self.authorized_client.get(reverse('posts:index'))
-        before_delete_post = response.content
-        Post.objects.filter(text='Проверка кеширования').delete()
+        self.assertContains(response, 'Проверка кеширования')
+        post.text = 'Новый текст'
+        post.save()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+
+    def test_cached_cards_are_not_personalized(self):
+        """Ссылка на редактирование не попадает в общий кеш"""
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.id})
         response = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(before_delete_post, response.content)
+        self.assertContains(response, edit_url)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, edit_url)
+        self.assertNotContains(response, f'Пользователь: {self.user.username}')
+
+    def test_cards_follow_author_and_group_changes(self):
+        """Имя автора и группа на карточке не берутся из кеша поста"""
+        self.guest_client.get(reverse('posts:index'))
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Переименованная группа'
+        group.slug = 'renamed'
+        group.save()
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Лев'
+        author.save()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'все записи группы Переименованная')
+        self.assertContains(response, reverse(
+            'posts:group_list', kwargs={'slug': 'renamed'}))
+        self.assertContains(response, 'Автор: Лев')
+
+    def test_feed_cache_invalidated_on_changes(self):
+        """Закешированные ленты сразу видят новые и изменённые посты"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'TestUser'}),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        new_post = Post.objects.create(
+            author=self.user, text='Свежий пост', group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.context['page_obj'][0], new_post)
+        other_group = Group.objects.create(title='Другая', slug='other')
+        new_post.group = other_group
+        new_post.save()
+        response = self.guest_client.get(urls[1])
+        self.assertNotIn(new_post, response.context['page_obj'])
+
+    @mock.patch('posts.management.commands.generate_thumbnails.default')
+    def test_generate_thumbnails_logs_failures(self, sorl):
+        """Команда режет пачками и пишет в лог пост, который не вышел"""
+        sorl.backend.generate.side_effect = OSError('битый файл')
+        out = StringIO()
+        with self.assertLogs('posts.management.commands', 'ERROR') as logs:
+            call_command('generate_thumbnails', batch_size=1, stdout=out)
+        self.assertIn('Готово: 0, ошибок: 1', out.getvalue())
+        self.assertIn(f'поста {self.post.pk}', logs.output[0])
+        self.assertIn('битый файл', logs.output[0])
+
+    def test_thumbnail_generated_in_background(self):
+        """Пока миниатюры нет, шаблон показывает заглушку и ничего не
+        пишет; миниатюру заказывает сохранение поста"""
+        job = Job.objects.get(key__startswith='thumbnail:')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertFalse([query for query in queries.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+        self.assertContains(response, 'bg-light')
+        self.assertNotContains(response, f'src="{self.post.image.url}"')
+        run_jobs()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'bg-light')
+        self.assertContains(response, '<img class="card-img my-2"')
+        # Упавшая миниатюра не ставится заново при каждом сохранении
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED)
+        self.post.save()
+        self.assertEqual(
+            Job.objects.filter(key=job.key).exclude(pk=job.pk).count(), 0)
 
     def test_post_create_have_correct_view(self):
         """Пост корректно отображается на страницах сайта"""
@@ -239,6 +343,59 @@ class PaginatorViewsTests(TestCase):
                 # Проверка: на второй странице должно быть 5 постов.
                 self.assertEqual(len(response.context['page_obj']), 5)
 
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсоры вперёд и назад обходят ленту без пропусков и повторов"""
+        Post.objects.update(pub_date=self.post.pub_date)
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True)
+        )
+        for reverse_name, template in CONTEXT.items():
+            with self.subTest(template=template):
+                response = self.client.get(reverse_name)
+                first_page = response.context['page_obj']
+                response = self.client.get(
+                    reverse_name + f'?cursor={first_page.next_cursor}'
+                )
+                second_page = response.context['page_obj']
+                self.assertIsNone(second_page.next_cursor)
+                self.assertEqual(
+                    [post.id for post in first_page]
+                    + [post.id for post in second_page],
+                    expected
+                )
+                response = self.client.get(
+                    reverse_name + f'?cursor={second_page.previous_cursor}'
+                )
+                self.assertEqual(
+                    [post.id for post in response.context['page_obj']],
+                    [post.id for post in first_page]
+                )
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор ведёт на первую страницу"""
+        response = self.client.get(reverse('posts:index') + '?cursor=%%%')
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+    def test_page_links_windowed_and_count_cached(self):
+        """Номера страниц — окно вокруг текущей, COUNT(*) берётся из кеша"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}') for i in range(200))
+        url = reverse('posts:index')
+        response = self.client.get(url + '?page=10')
+        self.assertEqual(response.context['page_obj'].paginator.num_pages,
+                         22)
+        content = response.content.decode()
+        for number in (1, 8, 12, 22):
+            self.assertIn(f'page={number}"', content)
+        for number in (2, 7, 13, 21):
+            self.assertNotIn(f'page={number}"', content)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url + '?page=11')
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+
 
 class FollowingTest(TestCase):
     @classmethod
@@ -296,3 +453,953 @@ class FollowingTest(TestCase):
         not_follower_client.force_login(self.not_follower)
         response = not_follower_client.get(reverse('posts:follow_index'))
         self.assertFalse(response.context.get('post'))
+
+    def test_new_post_added_to_followers_timeline(self):
+        """Новый пост автора попадает в ленты подписчиков"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        # До раскладки пост читается диапазоном автора
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        self.assertFalse(TimelineEntry.objects.filter(post=new_post).exists())
+        run_jobs()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.follower,
+                                         post=new_post).exists()
+        )
+        cache.clear()
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_fan_out_trims_timelines(self):
+        """Раскладка обрезает выросшие ленты до TIMELINE_MAX_LENGTH"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        for text in ('Первый', 'Второй', 'Третий'):
+            Post.objects.create(author=self.author, text=text)
+        run_jobs()
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.follower)
+                 .order_by('-pub_date').values_list('post__text', flat=True)),
+            ['Третий', 'Второй'],
+        )
+
+    def test_unfollow_prunes_timeline(self):
+        """После отписки посты автора убираются из ленты"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.follower_client.post(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author.username})
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+
+    @override_settings(FANOUT_FOLLOWERS_LIMIT=0)
+    def test_popular_author_posts_merged_on_read(self):
+        """Посты авторов с большим числом подписчиков не раскладываются
+        по лентам, а подмешиваются при чтении"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        run_jobs()
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists()
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post]
+        )
+
+
+class CommentsPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(author=cls.user, text='Вирусный пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_paginated_in_stable_order(self):
+        """Первая страница комментариев на месте, следующая — фрагментом"""
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual([comment.text for comment in comments],
+                         [f'Комментарий {i}' for i in range(20)])
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor})
+        self.assertTemplateUsed(response, 'includes/comments_page.html')
+        self.assertEqual([c.text for c in response.context['comments']],
+                         [f'Комментарий {i}' for i in range(20, 25)])
+        self.assertNotContains(response, 'js-more-comments')
+
+
+class ListingQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(5)
+        ]
+        for i in range(15):
+            author = cls.authors[i % len(cls.authors)]
+            Post.objects.create(
+                author=author,
+                text=f'Тестовый пост {i}',
+                group=cls.group,
+            )
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def listing_queries(self):
+        """Число запросов каждой ленты с пустым кешем"""
+        cache.clear()
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author0'}),
+            reverse('posts:follow_index'),
+        )
+        counts = {}
+        for url in pages:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts[url] = (len(queries), len(response.context['page_obj']))
+        return counts
+
+    def test_listing_queries_do_not_depend_on_page_size(self):
+        """Ленты выполняют одно и то же число запросов на 3 и 30 постах"""
+        Post.objects.exclude(author=self.authors[0]).delete()
+        few = self.listing_queries()
+        for i in range(27):
+            Post.objects.create(author=self.authors[0], text=f'Ещё {i}',
+                                group=self.group)
+        run_jobs()
+        many = self.listing_queries()
+        for url, (queries, size) in few.items():
+            with self.subTest(url=url):
+                self.assertEqual(size, 3)
+                self.assertEqual(many[url], (queries, 10))
+        # Лента — это список id и посты к нему одним запросом; в
+        # остальных лентах посты уже в кеше после главной. В группе и
+        # профиле первый запрос — поиск объекта для ETag, дальше он
+        # берётся из кеша объектов; профиль ещё читает рекомендации,
+        # ленте подписок они достаются из кеша. Лента подписок вместо
+        # списка id читает подписки, знаменитостей и свой диапазон
+        # ленты. Главная первой считает непрочитанные уведомления
+        self.assertEqual([queries for queries, size in many.values()],
+                         [5, 4, 7, 5])
+        # Повторно лента собирается из кеша: сессия и пользователь
+        with self.assertNumQueries(2):
+            self.authorized_client.get(reverse('posts:index'))
+
+    def test_unchanged_pages_return_not_modified(self):
+        """Неизменившаяся страница отдаётся ответом 304 без ленты"""
+        post = Post.objects.filter(author=self.authors[0]).first()
+        # Только сессия и пользователь: объекты из адреса уже в кеше
+        urls = {
+            reverse('posts:index'): 2,
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}): 2,
+            reverse('posts:profile', kwargs={'username': 'author0'}): 2,
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}): 2,
+            reverse('posts:follow_index'): 2,
+        }
+        etags = {}
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                etags[url] = self.authorized_client.get(url)['ETag']
+                with self.assertNumQueries(queries):
+                    response = self.authorized_client.get(
+                        url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 304)
+        index = reverse('posts:index')
+        response = self.client.get(index, HTTP_IF_NONE_MATCH=etags[index])
+        self.assertEqual(response.status_code, 200)
+        Comment.objects.create(post=post, author=self.user, text='Новый')
+        Follow.objects.filter(author=self.authors[0]).delete()
+        Post.objects.create(author=self.authors[0], text='Свежий',
+                            group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+
+    def test_group_and_author_edits_change_etag(self):
+        """Правка группы или автора меняет ETag страниц с ними"""
+        post = Post.objects.filter(author=self.authors[0]).first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author0'}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for change in ('group', 'author'):
+            etags = {url: self.authorized_client.get(url)['ETag']
+                     for url in urls}
+            if change == 'group':
+                self.group.title = 'Новое название'
+                self.group.save()
+            else:
+                self.authors[0].first_name = 'Новое имя'
+                self.authors[0].save()
+            for url in urls:
+                with self.subTest(change=change, url=url):
+                    response = self.authorized_client.get(
+                        url, HTTP_IF_NONE_MATCH=etags[url])
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], etags[url])
+        # Вход, смена пароля и сохранение без правок имени страниц
+        # не меняют
+        etag = self.authorized_client.get(urls[0])['ETag']
+        self.client.force_login(self.authors[0])
+        self.authors[0].set_password('новый-пароль')
+        self.authors[0].save()
+        User.objects.get(pk=self.authors[0].pk).save()
+        response = self.authorized_client.get(
+            urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.post = Post.objects.create(author=cls.author, text='Тестовый пост')
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        cache.clear()
+
+    def test_write_paths_update_counters(self):
+        """Посты, подписки и комментарии меняют счётчики"""
+        self.follower_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.author.username})
+        )
+        self.follower_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Комментарий'}
+        )
+        self.follower_client.post(
+            reverse('posts:post_create'), data={'text': 'Пост подписчика'}
+        )
+        author = UserCounters.objects.get(user=self.author)
+        follower = UserCounters.objects.get(user=self.follower)
+        self.assertEqual((author.posts, author.followers), (1, 1))
+        self.assertEqual((follower.posts, follower.following), (1, 1))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        Comment.objects.all().delete()
+        Follow.objects.all().delete()
+        author.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual((author.followers, self.post.comments_count), (0, 0))
+
+    def test_recount_repairs_drift(self):
+        """Команда recount_counters исправляет рассинхронизацию"""
+        UserCounters.objects.filter(user=self.author).update(posts=42)
+        Post.objects.filter(pk=self.post.pk).update(comments_count=7)
+        UserCounters.objects.filter(user=self.follower).delete()
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(
+            UserCounters.objects.get(user=self.author).posts, 1
+        )
+        self.assertTrue(
+            UserCounters.objects.filter(user=self.follower).exists()
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_profile_shows_counters(self):
+        response = self.follower_client.get(
+            reverse('posts:profile', kwargs={'username': 'author'})
+        )
+        self.assertEqual(response.context['counters'].posts, 1)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.relevant = Post.objects.create(
+            author=cls.user, text='Кошки любят рыбу, кошки мурлычут')
+        cls.other = Post.objects.create(
+            author=cls.user, text='Кошки спят весь день')
+        Post.objects.create(author=cls.user, text='Собаки гуляют')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:post_search'),
+                                   {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_finds_ranked_posts(self):
+        """Поиск находит посты со всеми словами запроса"""
+        self.assertEqual(self.search('рыбу кошки'), [self.relevant])
+        self.assertCountEqual(self.search('Кошки'),
+                              [self.relevant, self.other])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_post_changes(self):
+        """Индекс обновляется при изменении и удалении поста"""
+        self.other.text = 'Попугаи болтают'
+        self.other.save()
+        self.assertEqual(self.search('попугаи'), [self.other])
+        self.assertEqual(self.search('спят'), [])
+        Post.objects.filter(pk=self.other.pk).delete()
+        self.assertEqual(self.search('попугаи'), [])
+
+    def test_python_backend_and_rebuild(self):
+        """Запасной индекс на таблице даёт те же результаты"""
+        backend = search.TermTableBackend()
+        backend.index(Post.objects.all())
+        terms = search.tokenize('кошки')
+        self.assertEqual(backend.count(terms), 2)
+        self.assertEqual(backend.ids(terms, 0, 1), [self.relevant.pk])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('собаки гуляют')[0].text,
+                         'Собаки гуляют')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BenchmarkCommandsTests(TestCase):
+    def test_seed_and_bench_views(self):
+        """Наполнение базы и замер страниц выдают JSON по всем страницам"""
+        with mock.patch('posts.thumbnails.schedule'):
+            call_command('seed_data', scale=0.05, images=2,
+                         stdout=StringIO())
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(
+            UserCounters.objects.aggregate(total=Sum('posts'))['total'],
+            100)
+        posts_before = Post.objects.count()
+        cache.clear()
+        cache.set('sentinel', True)
+        output = StringIO()
+        call_command('bench_views', requests=3, warmup=1, cold=True,
+                     stdout=output)
+        report = json.loads(output.getvalue())
+        for name in ('index', 'group_posts', 'profile', 'post_detail',
+                     'follow_index', 'post_create', 'add_comment'):
+            self.assertIn(name, report)
+            self.assertLessEqual(report[name]['p50_ms'],
+                                 report[name]['p99_ms'])
+        self.assertEqual(report['index']['statuses'], [200])
+        self.assertEqual(report['post_create']['statuses'], [302])
+        self.assertEqual(Post.objects.count(), posts_before)
+        # Замер не чистит и не пачкает общий кеш
+        self.assertTrue(cache.get('sentinel'))
+        self.assertIsNone(cache.get('feed_head:index'))
+
+
+class TransferCommandsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.directory = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_import_builds_derived_data(self):
+        """Импорт пачками достраивает ленты, счётчики и поиск"""
+        cache.set('sentinel', True)
+        call_command('import_content', 'groups', self.write(
+            'groups.csv', 'title,slug,description\nКоты,cats,Про котов\n'
+        ), stdout=StringIO())
+        call_command('import_content', 'follows', self.write(
+            'follows.jsonl',
+            '{"user": "reader", "author": "writer"}\n'
+            '{"user": "reader", "author": "nobody"}\n'
+        ), stdout=StringIO())
+        output = StringIO()
+        call_command('import_content', 'posts', self.write(
+            'posts.jsonl',
+            '{"author": "writer", "group": "cats", "text": "Мурлыка",'
+            ' "pub_date": "2020-01-02T03:04:05"}\n'
+            '{"author": "nobody", "text": "Потерянный пост"}\n'
+        ), batch_size=1, stdout=output)
+        self.assertIn('пропущено 1', output.getvalue())
+        post = Post.objects.get()
+        self.assertEqual(post.group.slug, 'cats')
+        self.assertEqual(post.pub_date.year, 2020)
+        call_command('import_content', 'comments', self.write(
+            'comments.csv',
+            f'post,author,text,created\n{post.pk},reader,Мяу,\n'
+        ), stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.counters.posts, 1)
+        self.assertEqual(self.reader.counters.following, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        response = self.client.get(reverse('posts:post_search'),
+                                   {'q': 'мурлыка'})
+        self.assertEqual(list(response.context['page_obj']), [post])
+        # Сбрасываются только задетые области, а не весь кеш
+        self.assertTrue(cache.get('sentinel'))
+
+    def test_bad_rows_skipped_and_reported(self):
+        """Битые строки пропускаются с причиной, а не валят импорт"""
+        existing = Post.objects.create(author=self.author, text='Старый')
+        output = StringIO()
+        call_command('import_content', 'posts', self.write(
+            'bad.csv',
+            'id,author,group,text,pub_date,image\n'
+            f'{existing.pk},writer,,Занятый id,,\n'
+            '500,writer,,Новый,2020-01-02T03:04:05,\n'
+            '500,writer,,Повтор id,,\n'
+            ',writer,,Битая дата,2020-13-45T00:00:00,\n'
+            ',writer,,Не дата,вчера,\n'
+            ',nobody,,Чужой,,\n'
+            ',writer,,,,\n'
+        ), stdout=output)
+        self.assertCountEqual(Post.objects.values_list('text', flat=True),
+                              ['Старый', 'Новый'])
+        report = output.getvalue()
+        self.assertIn('прочитано 7, пропущено 6', report)
+        for reason in ('id уже занят: 2', 'неверная дата: 2',
+                       'неизвестный автор: 1', 'нет поля text: 1'):
+            self.assertIn(reason, report)
+
+    def test_export_round_trip(self):
+        """Выгрузка читается обратно импортом"""
+        Post.objects.create(author=self.author, text='Первый')
+        Post.objects.create(author=self.author, text='Второй')
+        for name in ('posts.jsonl', 'posts.csv'):
+            path = os.path.join(self.directory, name)
+            call_command('export_content', 'posts', path,
+                         stderr=StringIO())
+            Post.objects.all().delete()
+            call_command('import_content', 'posts', path, stdout=StringIO())
+            self.assertCountEqual(
+                Post.objects.values_list('text', flat=True),
+                ['Первый', 'Второй'])
+
+
+class RecommendationsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.friend, cls.popular, cls.neighbour, cls.loner = (
+            User.objects.create_user(username=name) for name in
+            ('reader', 'friend', 'popular', 'neighbour', 'loner'))
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.friend, author=cls.popular)
+        Follow.objects.create(user=cls.friend, author=cls.neighbour)
+        Post.objects.create(author=cls.reader, text='Пост', group=group)
+        Post.objects.create(author=cls.neighbour, text='Пост', group=group)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_friends_of_friends_ranked_and_updated_incrementally(self):
+        """Друзья друзей с общими группами выше, пересчёт — по изменениям"""
+        self.assertEqual(recommendations.update(full=True), 5)
+        top = list(self.reader.recommendations.order_by('-score')
+                   .values_list('candidate__username', flat=True))
+        self.assertEqual(top, ['neighbour', 'popular'])
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [c['username'] for c in response.context['who_to_follow']],
+            ['neighbour', 'popular'])
+        self.assertEqual(recommendations.update(), 0)
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'neighbour'}))
+        response = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': 'loner'}))
+        self.assertEqual(
+            [c['username'] for c in response.context['who_to_follow']],
+            ['popular'])
+        self.assertEqual(recommendations.update(), 1)
+
+    def test_mark_during_update_survives(self):
+        """Подписка во время расчёта оставляет отметку до следующего"""
+        recommendations.mark_stale(self.reader.pk)
+        load_graphs = recommendations.load_graphs
+
+        def follow_during_update():
+            recommendations.mark_stale(self.reader.pk)
+            return load_graphs()
+
+        with mock.patch.object(recommendations, 'load_graphs',
+                               follow_during_update):
+            recommendations.update()
+        self.assertTrue(StaleRecommendations.objects.filter(
+            user=self.reader).exists())
+        recommendations.update()
+        self.assertFalse(StaleRecommendations.objects.exists())
+
+    def test_csr_rows(self):
+        graph = recommendations.CSR.from_sorted_pairs(
+            [(1, 2), (1, 3), (3, 1)], 4)
+        self.assertEqual(list(graph.row(1)), [2, 3])
+        self.assertEqual(list(graph.row(2)), [])
+        self.assertEqual(list(graph.row(3)), [1])
+        self.assertEqual(list(graph.row(10)), [])
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.quiet, cls.busy = (
+            Group.objects.create(title=title, slug=slug,
+                                 description='Описание')
+            for title, slug in (('Тихая', 'quiet'), ('Шумная', 'busy')))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ranking_follows_activity(self):
+        """Рейтинг считается по комментариям и новым постам групп"""
+        Post.objects.create(author=self.user, text='Тихо', group=self.quiet)
+        calm, hot = (Post.objects.create(author=self.user, text=text,
+                                         group=self.busy)
+                     for text in ('Спокойный', 'Обсуждаемый'))
+        Comment.objects.create(post=calm, author=self.user, text='Да')
+        for _ in range(3):
+            Comment.objects.create(post=hot, author=self.user, text='Да')
+        ranking = trending.compute()
+        self.assertEqual([post['id'] for post in ranking['posts']],
+                         [hot.pk, calm.pk])
+        self.assertEqual([group['slug'] for group in ranking['groups']],
+                         ['busy', 'quiet'])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(len(captured), 0)
+        self.assertContains(response, 'Обсуждаемый')
+
+    def test_flush_moves_finished_buckets_to_database(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        Comment.objects.create(post=post, author=self.user, text='Да')
+        Comment.objects.create(post=post, author=self.user, text='Да')
+        bucket = trending.current_bucket()
+        with mock.patch.object(trending, 'current_bucket',
+                               return_value=bucket + 1):
+            trending.flush()
+            trending.flush()
+            ranking = trending.compute()
+        self.assertEqual(list(ActivityBucket.objects.values_list(
+            'kind', 'object_id', 'bucket', 'count')),
+            [(ActivityBucket.POST, post.pk, bucket, 2)])
+        self.assertEqual(ranking['posts'][0]['id'], post.pk)
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        cls.groups = [Group.objects.create(title=f'Группа {i}',
+                                           slug=f'group-{i}',
+                                           description='Описание')
+                      for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def create(self, count):
+        for i in range(count):
+            post = Post.objects.create(author=self.authors[i % 3],
+                                       group=self.groups[i % 3],
+                                       text=f'Пост {i}')
+            Comment.objects.create(post=post, author=self.authors[i % 3],
+                                   text='Комментарий')
+            Follow.objects.get_or_create(user=self.authors[i % 3],
+                                         author=self.authors[(i + 1) % 3])
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_changelists_hold_query_budget(self):
+        """Число запросов списка не зависит от числа строк"""
+        urls = [reverse(f'admin:posts_{name}_changelist')
+                for name in ('post', 'comment', 'follow')]
+        self.create(2)
+        few = [self.queries(url) for url in urls]
+        self.create(20)
+        cache.clear()
+        self.assertEqual([self.queries(url) for url in urls], few)
+        self.assertLessEqual(few[0], 8)
+
+    def test_author_filter_by_username(self):
+        self.create(3)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist') + '?author=author1')
+        self.assertEqual(
+            [post.author.username
+             for post in response.context['cl'].result_list],
+            ['author1'])
+        self.assertContains(response, 'name="author" value="author1"')
+
+    def test_later_pages_read_by_primary_keys(self):
+        self.create(5)
+        paginator = EstimatedCountPaginator(
+            Post.objects.order_by('-pk'), 2)
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual([post.text for post in paginator.page(2)],
+                         ['Пост 2', 'Пост 1'])
+        with mock.patch('posts.paginator.estimated_count',
+                        return_value=10 ** 6):
+            self.assertEqual(
+                EstimatedCountPaginator(Post.objects.all(), 2).count,
+                10 ** 6)
+
+
+class NotificationsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.followers = [User.objects.create_user(username=f'reader{i}')
+                         for i in range(5)]
+        for follower in cls.followers:
+            Follow.objects.create(user=follower, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader = Client()
+        self.reader.force_login(self.followers[0])
+
+    def test_followers_notified_in_chunks_outside_request(self):
+        """Уведомления пишутся задачами пачками, счётчик — в кеше"""
+        self.assertEqual(
+            notifications.unread_count(self.followers[0]), 0)
+        author = Client()
+        author.force_login(self.author)
+        author.post(reverse('posts:post_create'), {'text': 'Новый пост'})
+        self.assertFalse(Notification.objects.exists())
+        with mock.patch.object(notifications, 'FOLLOWERS_CHUNK', 2):
+            run_jobs()
+        self.assertEqual(Notification.objects.count(), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                notifications.unread_count(self.followers[0]), 1)
+        response = self.reader.get(reverse('posts:index'))
+        self.assertContains(response, 'badge bg-danger">1<')
+
+    def test_unread_badge_cleared_when_list_opened(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        notifications.deliver(post.pk, self.author.pk, 0)
+        # Повтор задачи не дублирует уведомления и не сдвигает счётчик
+        notifications.deliver(post.pk, self.author.pk, 0)
+        self.assertEqual(notifications.unread_count(self.followers[0]), 1)
+        response = self.reader.get(reverse('posts:notifications'))
+        self.assertEqual(len(response.context['notifications']), 1)
+        self.assertNotContains(response, 'badge bg-danger')
+        self.assertEqual(notifications.unread_count(self.followers[0]), 0)
+
+    def test_count_stored_after_delivery_expires(self):
+        """Подсчёт, записанный после рассылки, устаревает ненадолго"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        add = cache.add
+
+        def add_after_delivery(*args):
+            notifications.deliver(post.pk, self.author.pk, 0)
+            return add(*args)
+
+        with mock.patch.object(notifications.cache, 'add',
+                               add_after_delivery):
+            notifications.unread_count(self.followers[0])
+        self.assertEqual(notifications.unread_count(self.followers[0]), 0)
+        later = time.time() + notifications.UNREAD_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(
+                notifications.unread_count(self.followers[0]), 1)
+
+    def test_deleted_post_not_delivered(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        post.delete()
+        run_jobs()
+        self.assertFalse(Notification.objects.exists())
+
+
+class ObjectCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='leo')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.user, group=cls.group,
+                                       text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_objects_read_through_and_invalidated_by_signals(self):
+        """Объекты читаются из кеша до сохранения или удаления"""
+        object_cache.get(User, username='leo')
+        with self.assertNumQueries(0):
+            self.assertEqual(object_cache.get(User, username='leo'),
+                             self.user)
+            self.assertEqual(object_cache.get(User, pk=self.user.pk),
+                             self.user)
+        self.user.username = 'leon'
+        self.user.save()
+        with self.assertRaises(User.DoesNotExist):
+            object_cache.get(User, username='leo')
+        self.assertEqual(object_cache.get(User, username='leon').pk,
+                         self.user.pk)
+        self.group.delete()
+        with self.assertRaises(Group.DoesNotExist):
+            object_cache.get(Group, slug='group')
+
+    def test_invalidated_again_after_commit(self):
+        """Старая строка, закешированная до коммита, не переживает его"""
+        object_cache.get(Group, slug='group')
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            self.group.title = 'Новая'
+            self.group.save()
+        # Читатель до коммита видит старую строку
+        cache.set(object_cache._key(Group, 'pk', self.group.pk),
+                  Group(pk=self.group.pk, title='Группа', slug='group'))
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        self.assertEqual(object_cache.get(Group, pk=self.group.pk).title,
+                         'Новая')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_misses_read_from_primary(self):
+        """В общий кеш не попадает то, что прочитано с реплики"""
+        @routers.read_from_replica
+        def view(request):
+            # Реплики replica нет: чтение с неё упало бы
+            return (object_cache.get(Group, slug='group'),
+                    object_cache.get_post(self.post.pk),
+                    notifications.unread_count(self.user))
+
+        group, post, unread = view(RequestFactory().get('/'))
+        self.assertEqual((group, post, unread), (self.group, self.post, 0))
+
+    def test_only_rendered_fields_cached(self):
+        object_cache.get_post(self.post.pk)
+        user = cache.get(object_cache._key(User, 'pk', self.user.pk))
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertIn('email', user.get_deferred_fields())
+        self.assertEqual(user.get_full_name(), '')
+
+    def test_keys_safe_for_memcached(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            object_cache.get(Group, slug='group')
+            object_cache.get(User, username='leo')
+            with self.assertRaises(Group.DoesNotExist):
+                object_cache.get(Group, slug='Группа с пробелом')
+
+    def test_post_cached_with_author_and_group_separately(self):
+        with self.assertNumQueries(1):
+            object_cache.get_post(self.post.pk)
+        with self.assertNumQueries(0):
+            post = object_cache.get_post(self.post.pk)
+            self.assertEqual((post.author.username, post.group.slug),
+                             ('leo', 'group'))
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        self.assertEqual(object_cache.get_post(self.post.pk).comments_count,
+                         1)
+        self.assertEqual(
+            set(object_cache.get_many(Post, [self.post.pk, 0])),
+            {self.post.pk})
+
+    def test_hits_and_misses_in_server_timing(self):
+        url = reverse('posts:group_list', kwargs={'slug': 'group'})
+        self.assertNotIn('objmiss;desc="0"',
+                         self.client.get(url)['Server-Timing'])
+        header = self.client.get(url)['Server-Timing']
+        # Группа для ETag и для страницы, пост, его автор и группа
+        self.assertIn('objhit;desc="5"', header)
+        self.assertIn('objmiss;desc="0"', header)
+
+
+class FeedIdsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [Post.objects.create(author=cls.author,
+                                         text=f'Пост {i}')
+                     for i in range(12)]
+        run_jobs()
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def page_texts(self, url, **params):
+        response = self.reader_client.get(url, params)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_new_post_prepended_without_rebuilding_list(self):
+        """Новый пост встаёт в голову списка id без запроса ленты"""
+        for url in (reverse('posts:index'), reverse('posts:follow_index')):
+            self.reader_client.get(url)
+        Post.objects.create(author=self.author, text='Свежий')
+        run_jobs()
+        for url in (reverse('posts:index'), reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    texts = self.page_texts(url)
+                self.assertFalse([query for query in captured
+                                  if 'ORDER BY' in query['sql']])
+                self.assertEqual(texts[:2], ['Свежий', 'Пост 11'])
+
+    def test_feed_cache_changed_after_commit(self):
+        """Версии и списки лент меняются только после коммита записи"""
+        version = feed_cache.versions('index')[0]
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            Post.objects.create(author=self.author, text='Свежий')
+        self.assertEqual(feed_cache.versions('index')[0], version)
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        self.assertNotEqual(feed_cache.versions('index')[0], version)
+
+    def test_post_prepended_during_rebuild_not_lost(self):
+        """Пост, записанный, пока читатель собирает список, не теряется"""
+        url = reverse('posts:index')
+        snapshot = list(Post.objects.values_list('pk', flat=True))
+
+        def load_ids(limit):
+            # Снимок взят до записи поста, prepend() — в её сигнале
+            Post.objects.create(author=self.author, text='Свежий')
+            return sorted(snapshot, reverse=True)[:limit]
+
+        feed_cache.feed_ids(Post.objects.all(), 'index', load_ids=load_ids)
+        self.assertEqual(self.page_texts(url)[0], 'Свежий')
+
+    def test_cursor_pages_match_database_order(self):
+        url = reverse('posts:index')
+        response = self.reader_client.get(url)
+        second = self.page_texts(
+            url, cursor=response.context['page_obj'].next_cursor)
+        self.assertEqual(second, ['Пост 1', 'Пост 0'])
+        response = self.reader_client.get(
+            url, {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(
+            self.page_texts(
+                url, cursor=response.context['page_obj'].previous_cursor),
+            [f'Пост {i}' for i in range(11, 1, -1)])
+        self.assertEqual(self.page_texts(url, page=2), second)
+
+    def test_deleted_post_drops_stale_list(self):
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url)
+        Post.objects.filter(pk=self.posts[-1].pk).delete()
+        self.assertEqual(self.page_texts(url)[0], 'Пост 10')
+        self.assertEqual(len(self.page_texts(url)), 10)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы, которые выполняют ленты, идут по индексам, без
+    сортировки в памяти.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author,
+                                       text='Тестовый пост',
+                                       group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Комментарий')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertUsesIndexes(self, url):
+        """EXPLAIN каждого SELECT, выполненного страницей с пустым
+        кешем."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with connection.cursor() as cursor:
+            for query in captured:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                self.assertNotIn('TEMP B-TREE', plan, sql)
+                for line in plan.splitlines():
+                    if line.startswith('SCAN'):
+                        self.assertIn('INDEX', line, sql)
+
+    def test_views_use_indexes(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertUsesIndexes(url)
+
+    @override_settings(FANOUT_FOLLOWERS_LIMIT=0)
+    def test_follow_feed_reads_celebrity_range_by_index(self):
+        self.assertUsesIndexes(reverse('posts:follow_index'))
@@ -0,0 +1,75 @@
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+
+from core import jobs, timing
+
+# Все размеры, в которых шаблоны показывают картинки постов
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+
+@jobs.task
+def generate(name, geometry, options):
+    default.backend.generate(name, geometry, **dict(options))
+
+
+def schedule(name, geometry, options):
+    """Ставит миниатюру в очередь задач; пока она не готова, повторная
+    постановка не дублируется. Картинку, которую уже не удалось
+    нарезать, очередь больше не получает: её повторит generate_thumbnails.
+    """
+    key = f'thumbnail:{name}:{geometry}'
+    if not jobs.failed(key):
+        jobs.enqueue(generate, name, geometry, sorted(options.items()),
+                     key=key)
+
+
+def pregenerate(image):
+    """Заказывает все размеры, которые понадобятся шаблонам."""
+    if image:
+        for geometry, options in THUMBNAIL_SIZES:
+            schedule(image.name, geometry, options)
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не режет картинки во время рендера.
+
+    Готовая миниатюра берётся из kvstore; если её нет, шаблон получает
+    заглушку и рисует блок {% empty %}. Рендер ничего не пишет:
+    миниатюры заказывает сохранение поста (pregenerate), а для старых
+    постов — generate_thumbnails.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        with timing.measure('thumbnail'):
+            return self._lookup(file_, geometry_string, options)
+
+    def _lookup(self, file_, geometry_string, options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        thumbnail = default.kvstore.get(
+            self._thumbnail_file(file_, geometry_string, dict(options))
+        )
+        return thumbnail or DummyImageFile(geometry_string)
+
+    def generate(self, file_, geometry_string, **options):
+        """Синхронная генерация, как у обычного бэкенда sorl."""
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def _thumbnail_file(self, file_, geometry_string, options):
+        """Файл миниатюры с теми же опциями, что выставит get_thumbnail."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
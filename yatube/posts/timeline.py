@@ -0,0 +1,208 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from core import jobs
+from . import feed_cache
+from .models import Follow, Post, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+CELEBRITIES_KEY = 'timeline:celebrities'
+CELEBRITIES_TIMEOUT = 60 * 10
+
+
+def celebrity_ids():
+    """Авторы, чьи посты не раскладываются по лентам при записи."""
+    ids = cache.get(CELEBRITIES_KEY)
+    if ids is None:
+        ids = set(
+            Follow.objects.values('author')
+            .annotate(followers=Count('id'))
+            .filter(followers__gt=settings.FANOUT_FOLLOWERS_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(CELEBRITIES_KEY, ids, CELEBRITIES_TIMEOUT)
+    return ids
+
+
+def _pending_key(author_id):
+    return f'timeline:pending:{author_id}'
+
+
+def schedule(post):
+    """Ставит раскладку нового поста в очередь задач. Пока она не
+    закончилась, лента подписчика собирается с постами автора из его
+    диапазона, как у знаменитостей, и новый пост не теряет.
+    """
+    key = _pending_key(post.author_id)
+    cache.add(key, 0, settings.FEED_CACHE_TIMEOUT)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, settings.FEED_CACHE_TIMEOUT)
+    jobs.enqueue(fan_out, post.pk, post.author_id, 0,
+                 key=f'timeline:{post.pk}:0')
+
+
+def _settle(author_id):
+    try:
+        cache.decr(_pending_key(author_id))
+    except ValueError:
+        pass
+
+
+@jobs.task
+def fan_out(post_id, author_id, after):
+    """Раскладывает пост по лентам подписчиков с id подписки больше
+    after, FANOUT_BATCH_SIZE за задачу. Посты знаменитостей не
+    раскладываются: их новый пост сбрасывает все списки лент подписок.
+    """
+    pub_date = Post.objects.filter(pk=post_id).values_list(
+        'pub_date', flat=True).first()
+    if pub_date is None:
+        _settle(author_id)
+        return
+    followers = Follow.objects.filter(author_id=author_id)
+    if after == 0 and followers.values('pk')[
+            settings.FANOUT_FOLLOWERS_LIMIT:].exists():
+        if author_id not in celebrity_ids():
+            cache.delete(CELEBRITIES_KEY)
+        feed_cache.bump('celebrity_posts')
+        _settle(author_id)
+        return
+    follows = list(followers.filter(pk__gt=after).order_by('pk')
+                   .values_list('pk', 'user_id')[:FANOUT_BATCH_SIZE])
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for _, user_id in follows],
+        ignore_conflicts=True,
+    )
+    if follows:
+        batch = followers.filter(pk__gt=after, pk__lte=follows[-1][0])
+        for user_id in _overflowing(batch.values('user_id')):
+            trim(user_id)
+    scopes = [f'follow:{user_id}' for _, user_id in follows]
+    feed_cache.prepend(post_id, *scopes)
+    feed_cache.bump(*scopes)
+    if len(follows) == FANOUT_BATCH_SIZE:
+        last = follows[-1][0]
+        jobs.enqueue(fan_out, post_id, author_id, last,
+                     key=f'timeline:{post_id}:{last}')
+    else:
+        _settle(author_id)
+
+
+def deliver(posts):
+    """Раскладывает уже записанные посты по лентам подписчиков сразу, без
+    очереди: так их достраивает импорт, bulk_create которого не шлёт
+    сигналов. Возвращает области кеша, которые надо сбросить.
+    """
+    celebrities = celebrity_ids()
+    scopes = set()
+    if any(post.author_id in celebrities for post in posts):
+        scopes.add('celebrity_posts')
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.filter(
+            author_id__in={post.author_id for post in posts} - celebrities
+    ).values_list('user_id', 'author_id'):
+        followers[author_id].append(user_id)
+    entries = (TimelineEntry(user_id=user_id, post_id=post.pk,
+                             pub_date=post.pub_date)
+               for post in posts for user_id in followers[post.author_id])
+    while True:
+        chunk = list(islice(entries, FANOUT_BATCH_SIZE))
+        if not chunk:
+            break
+        TimelineEntry.objects.bulk_create(chunk, ignore_conflicts=True)
+    for user_id in set().union(*followers.values()):
+        trim(user_id)
+        scopes.add(f'follow:{user_id}')
+    return scopes
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if author_id in celebrity_ids():
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date')[:settings.TIMELINE_MAX_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim(user_id):
+    """Обрезает ленту пользователя до TIMELINE_MAX_LENGTH записей."""
+    oldest_kept = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date').values_list('pub_date', flat=True)[
+            settings.TIMELINE_MAX_LENGTH - 1:settings.TIMELINE_MAX_LENGTH]
+    if oldest_kept:
+        TimelineEntry.objects.filter(
+            user_id=user_id, pub_date__lt=oldest_kept[0]
+        ).delete()
+
+
+def _overflowing(user_ids):
+    """Пользователи из user_ids, чьи ленты длиннее TIMELINE_MAX_LENGTH."""
+    return TimelineEntry.objects.filter(user_id__in=user_ids).order_by() \
+        .values('user_id').annotate(entries=Count('id')) \
+        .filter(entries__gt=settings.TIMELINE_MAX_LENGTH) \
+        .values_list('user_id', flat=True)
+
+
+def _pulled_authors(user_id):
+    """Авторы из подписок, чьи посты берутся при чтении: знаменитости
+    и авторы с ещё не разложенными постами.
+    """
+    followed = list(Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True))
+    celebrities = celebrity_ids()
+    pending = cache.get_many([_pending_key(author_id)
+                              for author_id in followed])
+    return [author_id for author_id in followed
+            if author_id in celebrities or pending.get(
+                _pending_key(author_id))]
+
+
+def feed_ids(user_id, limit):
+    """Id постов ленты подписок от новых к старым: материализованная
+    лента и посты авторов, которые в неё не разложены. Каждый источник —
+    отдельный диапазон по индексу, слитые в Python без сортировки в базе.
+    """
+    ranges = [TimelineEntry.objects.filter(user_id=user_id)
+              .order_by('-pub_date', '-post_id')
+              .values_list('pub_date', 'post_id')[:limit]]
+    ranges.extend(Post.objects.filter(author_id=author_id)
+                  .order_by('-pub_date', '-id')
+                  .values_list('pub_date', 'id')[:limit]
+                  for author_id in _pulled_authors(user_id))
+    ids, seen = [], set()
+    for _, post_id in heapq.merge(*ranges, reverse=True):
+        if post_id not in seen:
+            seen.add(post_id)
+            ids.append(post_id)
+            if len(ids) == limit:
+                break
+    return ids
+
+
+def feed_for(user):
+    """Все посты авторов из подписок: запрос для страниц глубже списка
+    id ленты.
+    """
+    return Post.objects.filter(author__following__user=user)
@@ -0,0 +1,313 @@
+"""Потоковый импорт и экспорт контента в JSONL и CSV.
+
+Импорт читает файл пачками, каждая пачка пишется bulk_create в своей
+транзакции, авторы и группы ищутся одним запросом на пачку. Строки,
+которые нельзя записать (неизвестные ссылки, битые даты, занятые id),
+пропускаются и считаются по причинам. bulk_create не шлёт сигналов,
+поэтому ленты, счётчики и поиск достраиваются refresh() той же пачки:
+память не зависит от длины файла, а сбрасываются только задетые области
+кеша. Экспорт идёт через .iterator(), поэтому память не растёт с
+размером таблицы.
+"""
+import abc
+import csv
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, recommendations, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+FORMATS = ('jsonl', 'csv')
+
+
+def detect_format(path):
+    for name in FORMATS:
+        if path.endswith(f'.{name}'):
+            return name
+    return FORMATS[0]
+
+
+def read_rows(stream, format):
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RowWriter:
+    def __init__(self, stream, format, columns):
+        self.stream = stream
+        self.format = format
+        if format == 'csv':
+            self.writer = csv.DictWriter(stream, columns)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, cls=DjangoJSONEncoder,
+                                         ensure_ascii=False) + '\n')
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def preserved_dates():
+    """Отключает auto_now и auto_now_add, чтобы bulk_create сохранил
+    даты из файла, а не время импорта.
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _date(value):
+    """Дата из файла; None, если её не разобрать."""
+    if not value:
+        return timezone.now()
+    if isinstance(value, str):
+        try:
+            return parse_datetime(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _users(rows, *columns):
+    names = {row[column] for row in rows for column in columns}
+    return dict(User.objects.filter(username__in=names)
+                .values_list('username', 'pk'))
+
+
+class Kind(abc.ABC):
+    """Таблица, которую можно выгрузить и загрузить.
+
+    columns — имена колонок в файле, lookups — соответствующие им
+    выражения для values_list(), required — колонки, без которых строку
+    не записать.
+    """
+    model = None
+    columns = ()
+    lookups = ()
+    required = ()
+    ignore_conflicts = False
+
+    def export_rows(self, batch_size):
+        rows = self.model.objects.order_by('pk').values_list(*self.lookups)
+        for values in rows.iterator(chunk_size=batch_size):
+            yield dict(zip(self.columns, values))
+
+    @abc.abstractmethod
+    def build(self, rows, skipped):
+        """Объекты для bulk_create; пропущенные строки считаются в
+        skipped (Counter) по причинам.
+        """
+
+    def save(self, rows, skipped):
+        complete = []
+        for row in rows:
+            missing = [column for column in self.required
+                       if row.get(column) in (None, '')]
+            if missing:
+                skipped[f'нет поля {missing[0]}'] += 1
+            else:
+                complete.append(row)
+        objects = self.build(complete, skipped)
+        self.model.objects.bulk_create(
+            objects, ignore_conflicts=self.ignore_conflicts)
+        return objects
+
+    def refresh(self, objects):
+        """Достраивает производные данные записанной пачки; возвращает
+        области кеша, которые надо сбросить после коммита.
+        """
+        return set()
+
+
+class Groups(Kind):
+    model = Group
+    columns = lookups = ('title', 'slug', 'description')
+    required = ('title', 'slug')
+    ignore_conflicts = True
+
+    def build(self, rows, skipped):
+        return [Group(title=row['title'], slug=row['slug'],
+                      description=row.get('description') or '')
+                for row in rows]
+
+
+class Posts(Kind):
+    model = Post
+    columns = ('id', 'author', 'group', 'text', 'pub_date', 'image')
+    lookups = ('pk', 'author__username', 'group__slug', 'text', 'pub_date',
+               'image')
+    required = ('author', 'text')
+
+    def build(self, rows, skipped):
+        users = _users(rows, 'author')
+        slugs = {row['group'] for row in rows if row.get('group')}
+        groups = dict(Group.objects.filter(slug__in=slugs)
+                      .values_list('slug', 'pk'))
+        # Занятые id: уже в базе или раньше в этой же пачке
+        taken = set(Post.objects.filter(
+            pk__in={_id(row.get('id')) for row in rows} - {None}
+        ).values_list('pk', flat=True))
+        objects = []
+        for row in rows:
+            post_id = _id(row.get('id'))
+            pub_date = _date(row.get('pub_date'))
+            if row['author'] not in users:
+                skipped['неизвестный автор'] += 1
+                continue
+            if pub_date is None:
+                skipped['неверная дата'] += 1
+                continue
+            if row.get('id') and post_id is None:
+                skipped['неверный id'] += 1
+                continue
+            if post_id in taken:
+                skipped['id уже занят'] += 1
+                continue
+            if post_id is not None:
+                taken.add(post_id)
+            objects.append(Post(
+                pk=post_id,
+                author_id=users[row['author']],
+                group_id=groups.get(row.get('group')),
+                text=row['text'],
+                pub_date=pub_date,
+                updated=pub_date,
+                image=row.get('image') or '',
+            ))
+        return objects
+
+    def save(self, rows, skipped):
+        last = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        objects = super().save(rows, skipped)
+        if all(post.pk is not None for post in objects):
+            return objects
+        # SQLite не возвращает id из bulk_create: пачка — это строки выше
+        # прежнего максимума и строки с id из файла
+        return list(Post.objects.filter(
+            Q(pk__gt=last) | Q(pk__in=[post.pk for post in objects
+                                       if post.pk is not None])
+        ).only('pk', 'author_id', 'group_id', 'text', 'pub_date'))
+
+    def refresh(self, objects):
+        search.get_backend().index(objects)
+        authors = {post.author_id for post in objects}
+        counters.recount_user_ids(authors)
+        scopes = timeline.deliver(objects)
+        scopes.add('index')
+        scopes.update(f'profile:{author_id}' for author_id in authors)
+        scopes.update(f'counters:{author_id}' for author_id in authors)
+        scopes.update(f'group:{post.group_id}' for post in objects
+                      if post.group_id)
+        return scopes
+
+
+class Comments(Kind):
+    model = Comment
+    columns = ('post', 'author', 'text', 'created')
+    lookups = ('post_id', 'author__username', 'text', 'created')
+    required = ('post', 'author', 'text')
+
+    def build(self, rows, skipped):
+        users = _users(rows, 'author')
+        posts = set(Post.objects.filter(
+            pk__in={_id(row['post']) for row in rows} - {None}
+        ).values_list('pk', flat=True))
+        objects = []
+        for row in rows:
+            created = _date(row.get('created'))
+            if _id(row['post']) not in posts:
+                skipped['неизвестный пост'] += 1
+            elif row['author'] not in users:
+                skipped['неизвестный автор'] += 1
+            elif created is None:
+                skipped['неверная дата'] += 1
+            else:
+                objects.append(Comment(post_id=_id(row['post']),
+                                       author_id=users[row['author']],
+                                       text=row['text'],
+                                       created=created))
+        return objects
+
+    def refresh(self, objects):
+        posts = {comment.post_id for comment in objects}
+        counters.recount_post_ids(posts)
+        return {f'post:{post_id}' for post_id in posts}
+
+
+class Follows(Kind):
+    model = Follow
+    columns = ('user', 'author')
+    lookups = ('user__username', 'author__username')
+    required = ('user', 'author')
+    ignore_conflicts = True
+
+    def build(self, rows, skipped):
+        users = _users(rows, 'user', 'author')
+        objects = []
+        for row in rows:
+            if row['user'] not in users or row['author'] not in users:
+                skipped['неизвестный пользователь'] += 1
+            elif row['user'] == row['author']:
+                skipped['подписка на себя'] += 1
+            else:
+                objects.append(Follow(user_id=users[row['user']],
+                                      author_id=users[row['author']]))
+        return objects
+
+    def refresh(self, objects):
+        scopes = set()
+        for follow in objects:
+            timeline.backfill(follow.user_id, follow.author_id)
+            recommendations.mark_stale(follow.user_id)
+            scopes.update((f'follow:{follow.user_id}',
+                           f'counters:{follow.user_id}',
+                           f'counters:{follow.author_id}'))
+        counters.recount_user_ids(
+            {follow.user_id for follow in objects}
+            | {follow.author_id for follow in objects})
+        return scopes
+
+
+KINDS = {
+    'groups': Groups(),
+    'posts': Posts(),
+    'comments': Comments(),
+    'follows': Follows(),
+}
@@ -0,0 +1,140 @@
+"""Популярное: посты с активными обсуждениями и группы с новыми постами.
+
+События считаются в кеше по интервалам BUCKET_SECONDS. Первый счётчик
+объекта в интервале получает порядковый номер, поэтому все счётчики
+интервала читаются одним get_many без перебора ключей. Завершённые
+интервалы сбрасываются в ActivityBucket пачкой, а рейтинг с
+экспоненциальным затуханием пересчитывается командой update_trending
+раз в минуту и лежит в кеше целиком.
+"""
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import ActivityBucket, Group, Post
+
+BUCKET_SECONDS = 60 * 5
+WINDOW_BUCKETS = 24 * 60 * 60 // BUCKET_SECONDS
+HALF_LIFE = 60 * 60 * 6 // BUCKET_SECONDS
+TOP = 10
+RANKING_KEY = 'trending:ranking'
+FLUSHED_KEY = 'trending:flushed'
+# Счётчики живут, пока интервал может понадобиться рейтингу
+COUNTER_TIMEOUT = (WINDOW_BUCKETS + 2) * BUCKET_SECONDS
+RANKING_TIMEOUT = 60 * 10
+
+
+def current_bucket():
+    return int(time.time() // BUCKET_SECONDS)
+
+
+def _counter_key(bucket, kind, object_id):
+    return f'trending:{bucket}:{kind}:{object_id}'
+
+
+def _length_key(bucket):
+    return f'trending:{bucket}:length'
+
+
+def _slot_key(bucket, number):
+    return f'trending:{bucket}:slot:{number}'
+
+
+def record(kind, object_id):
+    """Засчитывает событие объекта в текущем интервале."""
+    bucket = current_bucket()
+    key = _counter_key(bucket, kind, object_id)
+    if cache.add(key, 1, COUNTER_TIMEOUT):
+        cache.add(_length_key(bucket), 0, COUNTER_TIMEOUT)
+        number = cache.incr(_length_key(bucket))
+        cache.set(_slot_key(bucket, number), (kind, object_id),
+                  COUNTER_TIMEOUT)
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Счётчик вытеснили между add и incr
+        cache.add(key, 1, COUNTER_TIMEOUT)
+
+
+def bucket_counts(bucket):
+    """{(вид, id): число} интервала из кеша."""
+    length = cache.get(_length_key(bucket)) or 0
+    slots = cache.get_many(
+        [_slot_key(bucket, number) for number in range(1, length + 1)])
+    keys = {_counter_key(bucket, *slot): slot for slot in slots.values()}
+    return {keys[key]: count for key, count in cache.get_many(keys).items()}
+
+
+def flush():
+    """Переносит завершённые интервалы из кеша в базу; повторный сброс
+    того же интервала ничего не меняет.
+    """
+    current = current_bucket()
+    first = cache.get(FLUSHED_KEY, current - WINDOW_BUCKETS) + 1
+    for bucket in range(max(first, current - WINDOW_BUCKETS), current):
+        ActivityBucket.objects.bulk_create(
+            [ActivityBucket(kind=kind, object_id=object_id, bucket=bucket,
+                            count=count)
+             for (kind, object_id), count in bucket_counts(bucket).items()],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        cache.set(FLUSHED_KEY, bucket, None)
+    ActivityBucket.objects.filter(
+        bucket__lte=current - WINDOW_BUCKETS).delete()
+
+
+def _scores():
+    current = current_bucket()
+    scores = defaultdict(float)
+    rows = (ActivityBucket.objects
+            .filter(bucket__gt=current - WINDOW_BUCKETS)
+            .values_list('kind', 'object_id', 'bucket', 'count'))
+    counts = {(kind, object_id, bucket): count
+              for kind, object_id, bucket, count in rows.iterator()}
+    # Текущий интервал ещё не сброшен в базу
+    for (kind, object_id), count in bucket_counts(current).items():
+        counts[kind, object_id, current] = count
+    for (kind, object_id, bucket), count in counts.items():
+        scores[kind, object_id] += count * 0.5 ** (
+            (current - bucket) / HALF_LIFE)
+    return scores
+
+
+def _top(scores, kind):
+    ranked = sorted(((score, object_id)
+                     for (item_kind, object_id), score in scores.items()
+                     if item_kind == kind), reverse=True)
+    return [(object_id, score) for score, object_id in ranked[:TOP]]
+
+
+def compute():
+    """Рейтинг с данными для шаблона, чтобы страница не ходила в базу."""
+    scores = _scores()
+    top_posts = _top(scores, ActivityBucket.POST)
+    top_groups = _top(scores, ActivityBucket.GROUP)
+    posts = Post.objects.select_related('author').only(
+        'text', 'author__username').in_bulk(
+            [object_id for object_id, _ in top_posts])
+    groups = Group.objects.only('slug', 'title').in_bulk(
+        [object_id for object_id, _ in top_groups])
+    ranking = {
+        'posts': [{'id': post_id,
+                   'text': posts[post_id].text[:200],
+                   'author': posts[post_id].author.username,
+                   'score': round(score, 2)}
+                  for post_id, score in top_posts if post_id in posts],
+        'groups': [{'slug': groups[group_id].slug,
+                    'title': groups[group_id].title,
+                    'score': round(score, 2)}
+                   for group_id, score in top_groups if group_id in groups],
+    }
+    cache.set(RANKING_KEY, ranking, RANKING_TIMEOUT)
+    return ranking
+
+
+def ranking():
+    """Готовый рейтинг; считается на месте, только если его ещё нет."""
+    return cache.get(RANKING_KEY) or compute()
@@ -10,15 +10,23 @@ urlpatterns = [
     path('index.html', views.index, name='index'),
     path('group/<slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('search/', views.post_search, name='post_search'),
+    path('trending/', views.trending_posts, name='trending'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
         name='add_comment'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('notifications/', views.notifications_list, name='notifications'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
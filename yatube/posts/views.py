@@ -1,81 +1,190 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
+import hashlib
+from functools import partial
+
+from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.http import urlencode
 from posts.models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
+from . import (counters, feed_cache, notifications, object_cache,
+               recommendations, search, timeline, trending)
+from .paginator import CachedCountPaginator, CursorPaginator
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.views.decorators.http import condition
+from core.routers import read_from_replica
 ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+
+
+# ETag страниц: неизменившаяся страница отдаётся ответом 304 без
+# запросов ленты и рендера шаблона
+def index_etag(request):
+    return feed_cache.etag(request, 'index')
+
+
+def group_etag(request, slug):
+    try:
+        group = object_cache.get(Group, slug=slug)
+    except Group.DoesNotExist:
+        return None
+    return feed_cache.etag(request, f'group:{group.pk}')
+
+
+def profile_etag(request, username):
+    try:
+        author_id = object_cache.get(User, username=username).pk
+    except User.DoesNotExist:
+        return None
+    return feed_cache.etag(request, f'profile:{author_id}',
+                           f'counters:{author_id}',
+                           f'follow:{request.user.pk}',
+                           f'recommendations:{request.user.pk}')
+
 
+def post_etag(request, post_id):
+    try:
+        author_id = object_cache.get(Post, pk=post_id).author_id
+    except Post.DoesNotExist:
+        return None
+    return feed_cache.etag(request, f'post:{post_id}',
+                           f'profile:{author_id}')
 
-@cache_page(20, key_prefix='index_page')
+
+def follow_etag(request):
+    return feed_cache.etag(request, 'index', 'celebrity_posts',
+                           f'follow:{request.user.pk}',
+                           f'recommendations:{request.user.pk}')
+
+
+@read_from_replica
+@condition(etag_func=index_etag)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.for_listing()
+    page_obj = feed_cache.cached_paginate(request, post_list, ON_PAGE,
+                                          'index')
     context = {'page_obj': page_obj}
     return render(request, 'posts/index.html', context)
 
 
+@read_from_replica
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = object_cache.get_or_404(Group, slug=slug)
+    post_list = group.posts.for_listing()
+    page_obj = feed_cache.cached_paginate(request, post_list, ON_PAGE,
+                                          f'group:{group.pk}')
     context = {'group': group,
                'page_obj': page_obj
                }
     return render(request, 'posts/group_list.html', context)
 
 
+@read_from_replica
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, ON_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = object_cache.get_or_404(User, username=username)
+    post_list = author.posts.for_listing()
+    page_obj = feed_cache.cached_paginate(request, post_list, ON_PAGE,
+                                          f'profile:{author.pk}')
     is_auth = request.user.is_authenticated and Follow.objects.filter(
         user=request.user, author=author).exists()
     context = {'page_obj': page_obj,
                'author': author,
+               'counters': counters.for_user(author),
                'following': is_auth,
+               'who_to_follow': recommendations.for_user(request.user),
                }
     return render(request, 'posts/profile.html', context)
 
 
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    results = search.SearchResults(query)
+    terms = hashlib.md5(' '.join(results.terms).encode()).hexdigest()
+    paginator = CachedCountPaginator(results, ON_PAGE,
+                                     count_key=f'search:{terms}')
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {'page_obj': page_obj,
+               'query': query,
+               'page_query': urlencode({'q': query}) + '&',
+               }
+    return render(request, 'posts/search.html', context)
+
+
+def trending_posts(request):
+    context = {'ranking': trending.ranking()}
+    return render(request, 'posts/trending.html', context)
+
+
+@read_from_replica
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = object_cache.get_post(post_id)
     form = CommentForm(request.POST or None)
     context = {'post': post,
+               'counters': counters.for_user(post.author),
                'form': form,
-               'comments': post.comments.all(),
+               'comments': comments_page(post),
                }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(post, cursor=None):
+    """Страница комментариев от старых к новым вместе с авторами."""
+    comments = post.comments.select_related('author').only(
+        'post', 'text', 'created', 'author__username'
+    ).order_by('created', 'id')
+    paginator = CursorPaginator(comments, COMMENTS_ON_PAGE,
+                                fields=('created', 'id'), descending=False)
+    return paginator.cursor_page(cursor)
+
+
+@read_from_replica
+@condition(etag_func=post_etag)
+def post_comments(request, post_id):
+    """Фрагмент со следующей страницей комментариев."""
+    post = object_cache.get_or_404(Post, pk=post_id)
+    context = {'post': post,
+               'comments': comments_page(post, request.GET.get('cursor')),
+               }
+    return render(request, 'includes/comments_page.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None)
     if form.is_valid():
         form.save(commit=False).author = request.user
-        form.save()
+        # Пост и его задачи (лента, уведомления, миниатюры) — одна
+        # транзакция: сбой между ними не потеряет рассылку
+        with transaction.atomic():
+            form.save()
         return redirect('posts:profile', username=request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@login_required
+def notifications_list(request):
+    shown = notifications.latest(request.user)
+    notifications.mark_read(request.user)
+    return render(request, 'posts/notifications.html',
+                  {'notifications': shown})
+
+
 @login_required
 def post_edit(request, post_id):
+    # Правится строка из базы, а не из кеша: устаревшие поля вроде
+    # comments_count из кеша затёрли бы настоящие при сохранении
     post = get_object_or_404(Post, pk=post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
                     instance=post)
-    author = post.author
-    if author != request.user:
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id=post_id)
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
         return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html', {'form': form,
                                                       'is_edit': True,
@@ -85,7 +194,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = object_cache.get_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -96,19 +205,23 @@ def add_comment(request, post_id):
 
 
 @login_required
+@read_from_replica
+@condition(etag_func=follow_etag)
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_number = request.GET.get('page')
-    paginator = Paginator(post_list, ON_PAGE)
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    post_list = timeline.feed_for(request.user).for_listing()
+    page_obj = feed_cache.cached_paginate(
+        request, post_list, ON_PAGE, 'index', f'follow:{request.user.pk}',
+        load_ids=partial(timeline.feed_ids, request.user.pk))
+    context = {'page_obj': page_obj,
+               'who_to_follow': recommendations.for_user(request.user),
+               }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
     # Подписаться на автора
-    author = get_object_or_404(User, username=username)
+    author = object_cache.get_or_404(User, username=username)
     if author != request.user:
         Follow.objects.get_or_create(
             user=request.user,
@@ -120,7 +233,7 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     # Дизлайк, отписка
-    author = get_object_or_404(User, username=username)
+    author = object_cache.get_or_404(User, username=username)
     Follow.objects.filter(user=request.user,
                           author__username=username,
                           ).delete()
@@ -1,4 +1,10 @@
 from django.contrib.auth import get_user_model, forms
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.sites.shortcuts import get_current_site
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core import jobs
 
 User = get_user_model()
 
@@ -11,3 +17,54 @@ class CreationForm(forms.UserCreationForm):
                   'username',
                   'email',
                   )
+
+
+@jobs.task
+def send_password_reset(user_id, domain, site_name, use_https,
+                        subject_template_name, email_template_name,
+                        from_email, html_email_template_name=None,
+                        extra_email_context=None):
+    """Собирает и отправляет письмо со ссылкой сброса пароля."""
+    user = User._default_manager.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.has_usable_password():
+        return
+    email = getattr(user, User.get_email_field_name())
+    context = {
+        'email': email,
+        'domain': domain,
+        'site_name': site_name,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'user': user,
+        'token': default_token_generator.make_token(user),
+        'protocol': 'https' if use_https else 'http',
+        **(extra_email_context or {}),
+    }
+    forms.PasswordResetForm().send_mail(
+        subject_template_name, email_template_name, context, from_email,
+        email, html_email_template_name)
+
+
+class QueuedPasswordResetForm(forms.PasswordResetForm):
+    """Письмо отправляется очередью задач: медленный SMTP не держит
+    страницу. В задаче только id пользователя и адрес сайта, ссылка со
+    сбросом пароля собирается при отправке и в таблице задач не лежит.
+    """
+
+    def save(self, domain_override=None,
+             subject_template_name='registration/password_reset_subject.txt',
+             email_template_name='registration/password_reset_email.html',
+             use_https=False, token_generator=default_token_generator,
+             from_email=None, request=None, html_email_template_name=None,
+             extra_email_context=None):
+        # token_generator в задачу не передать: она берёт стандартный,
+        # как и PasswordResetView
+        if domain_override:
+            site_name = domain = domain_override
+        else:
+            current_site = get_current_site(request)
+            site_name, domain = current_site.name, current_site.domain
+        for user in self.get_users(self.cleaned_data['email']):
+            jobs.enqueue(send_password_reset, user.pk, domain, site_name,
+                         use_https, subject_template_name,
+                         email_template_name, from_email,
+                         html_email_template_name, extra_email_context)
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +58,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -66,6 +68,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.notifications.'
+                'unread_notifications',
             ],
         },
     },
@@ -81,8 +85,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, прагмы ставятся один раз
+        'CONN_MAX_AGE': 60,
     }
 }
+# Прагмы для каждого нового соединения, см. core/db.py. В WAL читатели
+# не ждут писателя; NORMAL не теряет целостность при сбое процесса
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+SQLITE_LOCKED_RETRIES = 5
+
+# Реплики только для чтения. Для локальной проверки — копии файла базы
+# через запятую в SQLITE_REPLICAS, обновляет их manage.py sync_replicas
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+        filter(None, os.getenv('SQLITE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+# Сколько после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = 5
 
 
 # Password validation
@@ -132,9 +165,74 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Миниатюры режутся в очереди задач, шаблоны до готовности показывают
+# заглушку
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+
+# Очередь фоновых задач (core.jobs, manage.py run_jobs): аренда задачи
+# исполнителем, число попыток, первая задержка повтора и сколько хранить
+# выполненные задачи для статистики
+JOBS_LEASE_SECONDS = 5 * 60
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10
+JOBS_KEEP_DONE = 24 * 60 * 60
+
+# Лента подписок: длина материализованной ленты и порог подписчиков,
+# после которого посты автора подмешиваются при чтении
+TIMELINE_MAX_LENGTH = 1000
+FANOUT_FOLLOWERS_LIMIT = 10000
+
+# Доля запросов, для которых считается Server-Timing
+SERVER_TIMING_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+
+# Строки JSON с таймингами запросов (core.middleware) и пропускной
+# способностью исполнителей (core.jobs) пишутся в stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'level': 'INFO',
+        },
+    },
+    'loggers': {
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Cash
+# Общий для всех воркеров кеш в файле SQLite, см. core/cache.py
 CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    }
+}
+# Кеш тестов (core/test_runner.py, tests/fixtures): их cache.clear() не
+# должен трогать общий кеш сайта
+TEST_CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 }
+TEST_RUNNER = 'core.test_runner.TestRunner'
+# Списки id лент дополняются и сбрасываются сигналами, поэтому живут
+# долго
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Число записей для номеров страниц пересчитывается раз в 5 минут
+PAGINATOR_COUNT_TIMEOUT = 60 * 5